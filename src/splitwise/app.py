@@ -3,24 +3,61 @@ import streamlit as st
 from PIL import Image
 from loguru import logger
 import io
-import time
-from src.splitwise.llm_handler import call_llm_api_sync
+import math
+from concurrent.futures import ThreadPoolExecutor
+from src.splitwise.llm_handler import call_llm_api_sync, submit_llm_api
 from src.splitwise.bill_parser import parse_bill_input, split_instacart_bill
+from src.splitwise.utils import downscale_image, validate_image_upload
 
-# logger configuration
-logger.add("splitwise.log", rotation="1 MB", level="DEBUG")
+# logger configuration, once per process: Streamlit re-executes this script on every
+# rerun, and each logger.add() would register another sink writing every line again
+@st.cache_resource
+def _configure_logging() -> int:
+    return logger.add("splitwise.log", rotation="1 MB", level="DEBUG")
 
-st.set_page_config(
-    page_title="Bill Splitter", 
-    layout="centered",
-    page_icon="🧾",
-    initial_sidebar_state="collapsed"
+_configure_logging()
+
+# Session state owned by the app (including widget keys), cleared when starting a new bill
+SESSION_KEYS = (
+    "step", "structured_output", "structured_object", "final_output", "user_description",
+    "image_bytes_list", "regeneration", "regeneration_error", "user_description_input", "review_view",
 )
 
-# Custom CSS for better styling
-st.markdown("""
+STEPS = ("📤 Upload & Describe", "🔍 Review Results", "💰 Calculate Split", "📝 Feedback")
+
+# Step indicator HTML for each step, with the current step in bold
+STEP_INDICATOR_HTML = {
+    current: '<div class="step-indicator">' + " → ".join(
+        f"<strong>{step}</strong>" if i == current else step for i, step in enumerate(STEPS, start=1)
+    ) + '</div>'
+    for current in range(1, len(STEPS) + 1)
+}
+
+ITEM_CARD_TEMPLATE = (
+    '<div style="padding:10px; border:1px solid #ddd; border-radius:8px; margin:5px 0; background-color:#ffffff; color:#000000;">'
+    '<strong style="color:#333333;">{name}</strong> - <span style="color:#28a745; font-weight:bold;">${price:.2f}</span><br>'
+    '<small style="color:#666666;">👥 Shared by: {sharers}</small>'
+    '</div>'
+)
+
+# (icon, label, FeeCategorization field) for each fee breakdown expander in step 2
+FEE_GROUPS = (
+    ("📊", "Tax", "tax_items"),
+    ("🚚", "Delivery", "delivery_items"),
+    ("💰", "Tip", "tip_items"),
+)
+
+FEE_ROW_TEMPLATE = (
+    '<div style="padding:8px; border-left:4px solid {color}; margin:5px 0; background-color:#ffffff;">'
+    '<strong style="color:#333333;">{name}</strong><br>'
+    '<span style="color:{color}; font-size:1.1em; font-weight:bold;">${amount:.2f}</span> '
+    '<small style="color:#666666; margin-left:10px;">({category})</small>'
+    '</div>'
+)
+
+CUSTOM_CSS = """
 <style>
-    .stButton > button {
+    .stButton > button, .stFormSubmitButton > button {
         width: 100%;
         border-radius: 10px;
         border: 2px solid #f0f2f6;
@@ -28,7 +65,7 @@ st.markdown("""
         color: #262730;
         font-weight: 500;
     }
-    .stButton > button:hover {
+    .stButton > button:hover, .stFormSubmitButton > button:hover {
         border-color: #ff6b6b;
         color: #ff6b6b;
     }
@@ -49,29 +86,136 @@ st.markdown("""
         background-color: #f8f9fa;
         border-radius: 10px;
     }
-    .item-share-card {
-        padding: 10px;
-        border: 1px solid #ddd;
-        border-radius: 8px;
-        margin: 5px 0;
-        background-color: #f9f9f9;
-    }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+PAYMENT_CARD_TEMPLATE = (
+    '<div style="padding:15px; border:2px solid #28a745; border-radius:10px; margin:10px 0; background-color:#f8fff8;">'
+    '<h3 style="margin:0; color:#28a745;">{person}</h3>'
+    '<h2 style="margin:5px 0; color:#28a745;">${amount:.2f}</h2>'
+    '<p style="margin:0; color:#666;">({percentage:.1f}% of total bill)</p>'
+    '</div>'
+)
+
+@st.cache_data(max_entries=64, ttl=3600, show_spinner=False)
+def _preview(file_id: str, _uploaded_file) -> bytes:
+    """Downscaled JPEG preview of an uploaded image, generated once per unique upload.
+    
+    Keyed on the upload's file_id only (the leading underscore keeps Streamlit from
+    hashing the file), and the image is decoded straight from the upload buffer.
+    file_ids are never reused across uploads, so the cache is bounded in size and age.
+    """
+    _uploaded_file.seek(0)
+    image = Image.open(_uploaded_file)
+    image.thumbnail((512, 512))
+    with io.BytesIO() as preview:
+        image.convert("RGB").save(preview, format="JPEG", quality=80)
+        return preview.getvalue()
+
+def _sharer_names_by_item(persons, item_shares):
+    """Map each item name to the comma-separated full names of its sharers."""
+    return {
+        item_name: ", ".join(persons.get(abbr, abbr) for abbr in sharers)
+        for item_name, sharers in item_shares.items()
+    }
+
+@st.cache_data(ttl=600, show_spinner="Calculating split...")
+def _compute_split(structured_output: str):
+    """Parse the structured output and split the bill, once per unique output.
+    
+    Returns (parsed_data, splits), or (None, None) if the output can't be parsed.
+    """
+    parsed_data = parse_bill_input(structured_output)
+    if not parsed_data:
+        return None, None
+    splits = split_instacart_bill(
+        parsed_data['persons'],
+        parsed_data['items'], 
+        parsed_data['fees'],
+        parsed_data['item_shares']
+    )
+    return parsed_data, splits
+
+@st.cache_data(show_spinner=False)
+def _simple_summary(structured_output: str) -> str:
+    """Plain "person: amount" lines for the Copy Simple Summary button."""
+    _, splits = _compute_split(structured_output)
+    return "\n".join([f"{person}: ${amount:.2f}" for person, amount in splits.items()])
+
+@st.cache_data(show_spinner=False)
+def _detailed_summary(structured_output: str) -> str:
+    """Full text summary for the Copy Summary with Details button."""
+    parsed_data, splits = _compute_split(structured_output)
+    total_bill = sum(splits.values())
+    sharer_names_by_item = _sharer_names_by_item(parsed_data['persons'], parsed_data['item_shares'])
+    return f"""Bill Split Summary
+==================
+
+WHO PAYS WHAT:
+{chr(10).join([f"{person}: ${amount:.2f} ({(amount/total_bill)*100:.1f}%)" for person, amount in splits.items()])}
+
+TOTAL: ${total_bill:.2f}
+
+DETAILED BREAKDOWN:
+==================
+
+ITEMS & SHARING:
+{chr(10).join([f"• {item['name']}: ${item['price']:.2f} (shared by: {sharer_names_by_item.get(item['name'], '')})" for item in parsed_data['items']])}
+
+FEES:
+• Tax: ${parsed_data['fees'].get('Tax', 0):.2f} (distributed proportionally)
+• Delivery Fee: ${parsed_data['fees'].get('Delivery Fee', 0):.2f} (split equally)
+• Tip: ${parsed_data['fees'].get('Tip', 0):.2f} (split equally)
+
+Generated by Smart Bill Splitter AI"""
+
+@st.cache_data(show_spinner=False)
+def _chart_data(structured_output: str, _obj):
+    """Bar chart inputs for the Visual Breakdown view, as {column: {index: value}} dicts.
+    
+    Keyed on the structured output string only; _obj is the matching structured object
+    and is left unhashed. Returns (item_prices, non_zero_fees).
+    """
+    prices = {}
+    for item in _obj.items:
+        # Same-named lines would share one bar in the chart anyway
+        prices[item['name']] = prices.get(item['name'], 0) + item['price']
+    
+    # Show chart with ALL fees (including negative ones), skipping the zero ones
+    fees_chart_data = {
+        'Tax': _obj.fees.get('Tax', 0),
+        'Delivery Fee': _obj.fees.get('Delivery Fee', 0),
+        'Tip': _obj.fees.get('Tip', 0)
+    }
+    non_zero_fees = {k: v for k, v in fees_chart_data.items() if v != 0}
+    return {'price': prices}, {'Amount': non_zero_fees} if non_zero_fees else None
+
+st.set_page_config(
+    page_title="Bill Splitter", 
+    layout="centered",
+    page_icon="🧾",
+    initial_sidebar_state="collapsed"
+)
+
+# Custom CSS for better styling. Emitted on every run: Streamlit drops elements a rerun
+# doesn't re-render, so injecting it only once would lose the styles after the first rerun.
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 st.title("🧾 Smart Bill Splitter with AI")
 
 # Step indicator
-steps = ["📤 Upload & Describe", "🔍 Review Results", "💰 Calculate Split", "📝 Feedback"]
 current_step = st.session_state.get("step", 1)
 
-st.markdown('<div class="step-indicator">', unsafe_allow_html=True)
-progress_text = " → ".join([f"**{step}**" if i+1 == current_step else step for i, step in enumerate(steps)])
-st.markdown(progress_text, unsafe_allow_html=True)
-st.markdown('</div>', unsafe_allow_html=True)
+# One element, so the step-indicator div actually wraps the text
+st.markdown(STEP_INDICATOR_HTML.get(current_step, STEP_INDICATOR_HTML[1]), unsafe_allow_html=True)
+
+# Success message from the previous run, shown without holding up its rerun
+success_toast = st.session_state.pop("success_toast", None)
+if success_toast:
+    st.toast(success_toast)
 
 # Add progress bar
-progress = min(current_step / len(steps), 1.0)
+progress = min(current_step / len(STEPS), 1.0)
 st.progress(progress)
 
 # --- Session State ---
@@ -83,8 +227,6 @@ if "structured_object" not in st.session_state:
     st.session_state.structured_object = None
 if "final_output" not in st.session_state:
     st.session_state.final_output = None
-if "image_bytes" not in st.session_state:
-    st.session_state.image_bytes = None
 if "user_description" not in st.session_state:
     st.session_state.user_description = ""
 
@@ -92,111 +234,23 @@ if "user_description" not in st.session_state:
 if "image_bytes_list" not in st.session_state:
     st.session_state.image_bytes_list = None
 
-# --- Step 1: Upload + Description ---
-if st.session_state.step == 1:
-    st.subheader("📤 Step 1: Upload Your Bill")
-    
-    # Help section
-    with st.expander("💡 How to use this app"):
-        st.markdown("""
-        1. **Upload clear photos** of your bill/receipt (you can upload multiple images)
-        2. **Describe who shared what** - be specific!
-        3. **Review the AI results** and provide feedback if needed
-        4. **Get your split calculation** automatically
-        
-        **Multiple Images:** If your bill spans multiple pages or you have separate receipt images, upload them all!
-        
-        **Example description:**
-        "Vikram and Alice shared the pizza and drinks. Vikram had the salad alone. Alice had the dessert alone."
-        """)
-    
-    # Multiple file upload
-    uploaded_files = st.file_uploader(
-        "Upload bill images", 
-        type=["jpg", "png", "jpeg"],
-        accept_multiple_files=True,  # Enable multiple file upload
-        help="Upload clear photos of your receipt(s). You can select multiple images. JPG, PNG, and JPEG formats are supported."
-    )
-    
-    # Show image previews for all uploaded files
-    if uploaded_files:
-        st.markdown(f"**📸 Uploaded Images ({len(uploaded_files)} files):**")
-        
-        # Create columns for image display (max 3 per row)
-        cols_per_row = 3
-        for i in range(0, len(uploaded_files), cols_per_row):
-            cols = st.columns(cols_per_row)
-            for j, uploaded_file in enumerate(uploaded_files[i:i+cols_per_row]):
-                with cols[j]:
-                    image = Image.open(uploaded_file)
-                    st.image(image, caption=f"Image {i+j+1}: {uploaded_file.name}", use_container_width=True)
-    
-    # Description with better prompts
-    user_description = st.text_area(
-        "Describe who shared what",
-        placeholder="Example: Vikram and Alice shared the pizza. Vikram had the burger alone. Alice had the salad alone.",
-        help="Be specific about which items each person consumed. Use full names for clarity.",
-        height=100,
-        key="user_description_input"
-    )
-    
-    # Validation for multiple files
-    can_process = uploaded_files is not None and len(uploaded_files) > 0 and st.session_state.user_description_input.strip() != ""
-    
-    if not can_process:
-        if not uploaded_files or len(uploaded_files) == 0:
-            st.warning("⚠️ Please upload at least one image.")
-        if st.session_state.user_description_input.strip() == "":
-            st.warning("⚠️ Please provide a description to continue.")
-    
-    # Process multiple images
-    if can_process:
-        st.markdown('<div class="success-button">', unsafe_allow_html=True)
-        if st.button("🚀 Generate Structured Output"):
-            logger.info(f"Processing {len(uploaded_files)} uploaded bill images")
-            logger.debug(f"User description: {st.session_state.user_description_input}")
-
-            # Convert all images to bytes
-            image_bytes_list = []
-            for uploaded_file in uploaded_files:
-                image = Image.open(uploaded_file)
-                image_bytes = io.BytesIO()
-                image.save(image_bytes, format='PNG')
-                image_bytes_list.append(image_bytes.getvalue())
-            
-            # Store in session state for feedback functionality
-            st.session_state.image_bytes_list = image_bytes_list
-            st.session_state.user_description = st.session_state.user_description_input
-
-            with st.spinner(f"🤖 AI is analyzing your {len(uploaded_files)} receipt image(s)..."):
-                try:
-                    structured_object, structured_output = call_llm_api_sync(
-                        image_bytes_list, st.session_state.user_description_input
-                    )
-                    if structured_object and structured_output:
-                        st.session_state.structured_object = structured_object
-                        st.session_state.structured_output = structured_output
-                        st.session_state.step = 2
-                        st.success("✅ Receipt(s) processed successfully!")
-                        time.sleep(1)
-                        st.rerun()
-                    else:
-                        st.error("❌ Failed to process receipt(s). Please try again.")
-                except Exception as e:
-                    st.error(f"❌ Error processing receipt(s): {str(e)}")
-                    logger.error(f"Processing error: {e}")
-        st.markdown('</div>', unsafe_allow_html=True)
-    else:
-        st.button("🚀 Generate Structured Output", disabled=True)
-
 # --- Step 2: Review Structured Output ---
-elif st.session_state.step == 2:
+# Runs as a fragment so view switches and expanders only rerun this step;
+# the navigation buttons trigger a full app rerun via st.rerun()
+@st.fragment
+def render_review_step():
     st.subheader("🔍 Step 2: Review AI Results")
     
-    # Tabs for better organization
-    tab1, tab2, tab3 = st.tabs(["📋 Structured Data", "📊 Visual Breakdown", "🔧 Raw Output"])
+    # A radio instead of st.tabs: tabs render every panel on each run, this only renders the selected one
+    view = st.radio(
+        "View",
+        ["📋 Structured Data", "📊 Visual Breakdown", "🔧 Raw Output"],
+        horizontal=True,
+        label_visibility="collapsed",
+        key="review_view",
+    )
     
-    with tab1:
+    if view == "📋 Structured Data":
         if st.session_state.structured_object:
             obj = st.session_state.structured_object
             
@@ -214,20 +268,17 @@ elif st.session_state.step == 2:
             
             # FIX #1: Items with sharing information - Fix card text visibility
             st.markdown("### 🛒 Items & Sharing")
-            for item in obj.items:
-                item_name = item['name']
-                item_price = item['price']
-                
-                # Get who shares this item
-                sharers = obj.item_shares.get(item_name, [])
-                sharer_names = [obj.persons.get(abbr, abbr) for abbr in sharers]
-                
-                st.markdown(f"""
-                <div style="padding:10px; border:1px solid #ddd; border-radius:8px; margin:5px 0; background-color:#ffffff; color:#000000;">
-                    <strong style="color:#333333;">{item_name}</strong> - <span style="color:#28a745; font-weight:bold;">${item_price:.2f}</span><br>
-                    <small style="color:#666666;">👥 Shared by: {', '.join(sharer_names) if sharer_names else 'No one assigned'}</small>
-                </div>
-                """, unsafe_allow_html=True)
+            # All cards go out in a single markdown element instead of one per item
+            sharer_names_by_item = _sharer_names_by_item(obj.persons, obj.item_shares)
+            item_cards = "".join(
+                ITEM_CARD_TEMPLATE.format(
+                    name=item['name'],
+                    price=item['price'],
+                    sharers=sharer_names_by_item.get(item['name']) or "No one assigned",
+                )
+                for item in obj.items
+            )
+            st.markdown(item_cards, unsafe_allow_html=True)
             
             # FIX #5: Fee breakdown with explanatory text AND detailed breakdown
             st.markdown("### 💳 Fee Categories (AI Processed)")
@@ -255,72 +306,46 @@ elif st.session_state.step == 2:
             st.markdown("### 🔍 Fee Category Breakdown")
             st.markdown("*See which original receipt fees were categorized into each type*")
             
-            # Create expandable sections for each fee category
-            if obj.raw_fees.tax_items:
-                with st.expander(f"📊 Tax Items ({len(obj.raw_fees.tax_items)} fees totaling ${sum(fee.amount for fee in obj.raw_fees.tax_items):.2f})"):
-                    for fee in obj.raw_fees.tax_items:
-                        color = "#d32f2f" if fee.amount < 0 else "#388e3c"
-                        st.markdown(f"""
-                        <div style="padding:8px; border-left:4px solid {color}; margin:5px 0; background-color:#ffffff;">
-                            <strong style="color:#333333;">{fee.name}</strong><br>
-                            <span style="color:{color}; font-size:1.1em; font-weight:bold;">${fee.amount:.2f}</span>
-                            <small style="color:#666666; margin-left:10px;">({fee.category})</small>
-                        </div>
-                        """, unsafe_allow_html=True)
-            else:
-                st.info("ℹ️ No Tax items found")
-            
-            if obj.raw_fees.delivery_items:
-                with st.expander(f"🚚 Delivery Items ({len(obj.raw_fees.delivery_items)} fees totaling ${sum(fee.amount for fee in obj.raw_fees.delivery_items):.2f})"):
-                    for fee in obj.raw_fees.delivery_items:
-                        color = "#d32f2f" if fee.amount < 0 else "#388e3c"
-                        st.markdown(f"""
-                        <div style="padding:8px; border-left:4px solid {color}; margin:5px 0; background-color:#ffffff;">
-                            <strong style="color:#333333;">{fee.name}</strong><br>
-                            <span style="color:{color}; font-size:1.1em; font-weight:bold;">${fee.amount:.2f}</span>
-                            <small style="color:#666666; margin-left:10px;">({fee.category})</small>
-                        </div>
-                        """, unsafe_allow_html=True)
-            else:
-                st.info("ℹ️ No Delivery items found")
-            
-            if obj.raw_fees.tip_items:
-                with st.expander(f"💰 Tip Items ({len(obj.raw_fees.tip_items)} fees totaling ${sum(fee.amount for fee in obj.raw_fees.tip_items):.2f})"):
-                    for fee in obj.raw_fees.tip_items:
-                        color = "#d32f2f" if fee.amount < 0 else "#388e3c"
-                        st.markdown(f"""
-                        <div style="padding:8px; border-left:4px solid {color}; margin:5px 0; background-color:#ffffff;">
-                            <strong style="color:#333333;">{fee.name}</strong><br>
-                            <span style="color:{color}; font-size:1.1em; font-weight:bold;">${fee.amount:.2f}</span>
-                            <small style="color:#666666; margin-left:10px;">({fee.category})</small>
-                        </div>
-                        """, unsafe_allow_html=True)
-            else:
-                st.info("ℹ️ No Tip items found")
+            # One expander per fee category; each category is summed once and reused for validation
+            category_totals = []
+            for icon, label, attr in FEE_GROUPS:
+                fees = getattr(obj.raw_fees, attr)
+                category_total = math.fsum(fee.amount for fee in fees)
+                category_totals.append(category_total)
+                if fees:
+                    with st.expander(f"{icon} {label} Items ({len(fees)} fees totaling ${category_total:.2f})"):
+                        st.html("".join(
+                            FEE_ROW_TEMPLATE.format(
+                                color="#d32f2f" if fee.amount < 0 else "#388e3c",
+                                name=fee.name,
+                                amount=fee.amount,
+                                category=fee.category,
+                            )
+                            for fee in fees
+                        ))
+                else:
+                    st.info(f"ℹ️ No {label} items found")
             
             # Summary validation
-            total_from_raw = (sum(fee.amount for fee in obj.raw_fees.tax_items) + 
-                            sum(fee.amount for fee in obj.raw_fees.delivery_items) + 
-                            sum(fee.amount for fee in obj.raw_fees.tip_items))
-            total_from_calculated = sum(obj.fees.values())
+            # fsum keeps float error out of the 1-cent comparison below
+            total_from_raw = math.fsum(category_totals)
+            total_from_calculated = math.fsum(obj.fees.values())
             
             if abs(total_from_raw - total_from_calculated) > 0.01:  # Allow for small rounding differences
                 st.warning(f"⚠️ Calculation mismatch: Raw total (${total_from_raw:.2f}) ≠ Calculated total (${total_from_calculated:.2f})")
             else:
                 st.success(f"✅ Fee categorization verified: Total ${total_from_calculated:.2f}")
     
-    with tab2:
+    elif view == "📊 Visual Breakdown":
         # Visual breakdown using charts
         if st.session_state.structured_object:
-            import pandas as pd
-            
             obj = st.session_state.structured_object
+            item_prices, non_zero_fees = _chart_data(st.session_state.structured_output, obj)
             
             # Items chart
             if obj.items:
                 st.subheader("📊 Item Costs")
-                items_df = pd.DataFrame(obj.items)
-                st.bar_chart(items_df.set_index('name')['price'])
+                st.bar_chart(item_prices)
             
             # FIX #4: Fees breakdown - include all fees, even negative ones
             st.subheader("💳 Fee Distribution")
@@ -340,29 +365,20 @@ elif st.session_state.step == 2:
                     tip_val = fees_data.get('Tip', 0)
                     st.metric("Tip", f"${tip_val:.2f}", delta=f"${tip_val:.2f}" if tip_val != 0 else None)
                 
-                # Show chart with ALL fees (including negative ones)
-                fees_chart_data = {
-                    'Tax': fees_data.get('Tax', 0),
-                    'Delivery Fee': fees_data.get('Delivery Fee', 0),
-                    'Tip': fees_data.get('Tip', 0)
-                }
-                
                 # Only show chart if there are non-zero values
-                non_zero_fees = {k: v for k, v in fees_chart_data.items() if v != 0}
                 if non_zero_fees:
-                    import pandas as pd
-                    fees_chart_df = pd.DataFrame(list(non_zero_fees.items()), columns=['Fee Type', 'Amount'])
-                    st.bar_chart(fees_chart_df.set_index('Fee Type')['Amount'])
+                    st.bar_chart(non_zero_fees)
                 else:
                     st.info("No fees to display in chart")
             
             # Show sharing breakdown
             st.subheader("👥 Item Sharing Breakdown")
-            for item_name, sharers in obj.item_shares.items():
-                sharer_names = [obj.persons.get(abbr, abbr) for abbr in sharers]
-                st.write(f"**{item_name}**: {', '.join(sharer_names)}")
+            st.markdown("  \n".join(
+                f"**{item_name}**: {sharer_names}"
+                for item_name, sharer_names in _sharer_names_by_item(obj.persons, obj.item_shares).items()
+            ))
     
-    with tab3:
+    elif view == "🔧 Raw Output":
         st.code(st.session_state.structured_output, language='text')
     
     # Action buttons with better spacing
@@ -387,57 +403,184 @@ elif st.session_state.step == 2:
     
     with col3:
         if st.button("🔄 Start Over"):
-            # Reset all session state
-            for key in list(st.session_state.keys()):
-                del st.session_state[key]
+            # Reset the app's own session state
+            for key in SESSION_KEYS:
+                st.session_state.pop(key, None)
+            st.rerun()
+
+# --- Step 4: regeneration in progress ---
+# Polls the pending regeneration once a second without blocking the rest of the page
+@st.fragment(run_every=1)
+def poll_regeneration():
+    future = st.session_state.regeneration
+    if not future.done():
+        st.info("🤖 Regenerating structured data with your feedback...")
+        if st.button("✖️ Cancel"):
+            future.cancel()
+            del st.session_state.regeneration
             st.rerun()
+        return
+    
+    del st.session_state.regeneration
+    try:
+        structured_object, structured_output = future.result()
+        if structured_object and structured_output:
+            st.session_state.structured_object = structured_object
+            st.session_state.structured_output = structured_output
+            st.session_state.step = 2
+            st.session_state.success_toast = "✅ Results regenerated successfully!"
+        else:
+            st.session_state.regeneration_error = "❌ Failed to regenerate. Please try again."
+    except Exception as e:
+        st.session_state.regeneration_error = f"❌ Error regenerating: {str(e)}"
+        logger.error(f"Regeneration error: {e}")
+    st.rerun()
+
+# --- Step 1: Upload + Description ---
+# Runs as a fragment so adding or removing uploads only reruns this step;
+# a successful submit moves on with a full app rerun via st.rerun()
+@st.fragment
+def render_upload_step():
+    st.subheader("📤 Step 1: Upload Your Bill")
+    
+    # Help section
+    with st.expander("💡 How to use this app"):
+        st.markdown("""
+        1. **Upload clear photos** of your bill/receipt (you can upload multiple images)
+        2. **Describe who shared what** - be specific!
+        3. **Review the AI results** and provide feedback if needed
+        4. **Get your split calculation** automatically
+        
+        **Multiple Images:** If your bill spans multiple pages or you have separate receipt images, upload them all!
+        
+        **Example description:**
+        "Vikram and Alice shared the pizza and drinks. Vikram had the salad alone. Alice had the dessert alone."
+        """)
+    
+    # Multiple file upload
+    uploaded_files = st.file_uploader(
+        "Upload bill images", 
+        type=["jpg", "png", "jpeg"],
+        accept_multiple_files=True,  # Enable multiple file upload
+        help="Upload clear photos of your receipt(s). You can select multiple images. JPG, PNG, and JPEG formats are supported."
+    )
+    
+    # Reject oversize or non-JPEG/PNG files before any image decoding happens
+    upload_errors = [error for error in (validate_image_upload(f) for f in uploaded_files or []) if error]
+    for error in upload_errors:
+        st.error(f"❌ {error}")
+    
+    # Show image previews for all uploaded files
+    if uploaded_files and not upload_errors:
+        st.markdown(f"**📸 Uploaded Images ({len(uploaded_files)} files):**")
+        
+        # Create columns for image display (max 3 per row)
+        cols_per_row = 3
+        for i in range(0, len(uploaded_files), cols_per_row):
+            cols = st.columns(cols_per_row)
+            for j, uploaded_file in enumerate(uploaded_files[i:i+cols_per_row]):
+                with cols[j]:
+                    st.image(_preview(uploaded_file.file_id, uploaded_file), caption=f"Image {i+j+1}: {uploaded_file.name}", use_container_width=True)
+    
+    # Description and submit button in a form, so typing doesn't rerun the script
+    with st.form("describe_form", border=False):
+        st.text_area(
+            "Describe who shared what",
+            placeholder="Example: Vikram and Alice shared the pizza. Vikram had the burger alone. Alice had the salad alone.",
+            help="Be specific about which items each person consumed. Use full names for clarity.",
+            height=100,
+            key="user_description_input"
+        )
+        submitted = st.form_submit_button(
+            "🚀 Generate Structured Output",
+            disabled=not uploaded_files or bool(upload_errors)
+        )
+    
+    if not uploaded_files:
+        st.warning("⚠️ Please upload at least one image.")
+    
+    # Process multiple images
+    if submitted:
+        if st.session_state.user_description_input.strip() == "":
+            st.warning("⚠️ Please provide a description to continue.")
+        else:
+            logger.info(f"Processing {len(uploaded_files)} uploaded bill images")
+            logger.debug(f"User description: {st.session_state.user_description_input}")
+
+            # Send the uploaded JPEG/PNG bytes as-is unless they exceed MAX_IMAGE_DIMENSION.
+            # Pillow releases the GIL while decoding/resizing, so oversized photos shrink in parallel.
+            with ThreadPoolExecutor(max_workers=min(8, len(uploaded_files))) as executor:
+                image_bytes_list = list(executor.map(
+                    downscale_image, [uploaded_file.getvalue() for uploaded_file in uploaded_files]
+                ))
+        
+            # Store in session state for feedback functionality
+            st.session_state.image_bytes_list = image_bytes_list
+            st.session_state.user_description = st.session_state.user_description_input
+
+            with st.spinner(f"🤖 AI is analyzing your {len(uploaded_files)} receipt image(s)..."):
+                try:
+                    structured_object, structured_output = call_llm_api_sync(
+                        image_bytes_list, st.session_state.user_description_input
+                    )
+                    if structured_object and structured_output:
+                        st.session_state.structured_object = structured_object
+                        st.session_state.structured_output = structured_output
+                        st.session_state.step = 2
+                        st.session_state.success_toast = "✅ Receipt(s) processed successfully!"
+                        st.rerun()
+                    else:
+                        st.error("❌ Failed to process receipt(s). Please try again.")
+                except Exception as e:
+                    st.error(f"❌ Error processing receipt(s): {str(e)}")
+                    logger.error(f"Processing error: {e}")
+
+if st.session_state.step == 1:
+    render_upload_step()
+
+# --- Step 2: Review Structured Output ---
+elif st.session_state.step == 2:
+    render_review_step()
 
 # --- Step 3: Run Split Logic ---
 elif st.session_state.step == 3:
     st.subheader("💰 Step 3: Your Bill Split")
     
-    # Parse and calculate
-    parsed_data = parse_bill_input(st.session_state.structured_output)
+    # Parse and calculate (memoized on the structured output)
+    parsed_data, splits = _compute_split(st.session_state.structured_output)
     
     if parsed_data:
-        splits = split_instacart_bill(
-            parsed_data['persons'],
-            parsed_data['items'], 
-            parsed_data['fees'],
-            parsed_data['item_shares']
-        )
         st.session_state.final_output = splits
         
         # Display results with better formatting
         st.markdown("### 💸 Who Pays What")
         
-        # Create visual payment cards
+        # Create visual payment cards, rendered as a single markdown element
         total_bill = sum(splits.values())
         
-        for person, amount in splits.items():
-            percentage = (amount / total_bill) * 100 if total_bill > 0 else 0
-            
-            st.markdown(f"""
-            <div style="padding:15px; border:2px solid #28a745; border-radius:10px; margin:10px 0; background-color:#f8fff8;">
-                <h3 style="margin:0; color:#28a745;">{person}</h3>
-                <h2 style="margin:5px 0; color:#28a745;">${amount:.2f}</h2>
-                <p style="margin:0; color:#666;">({percentage:.1f}% of total bill)</p>
-            </div>
-            """, unsafe_allow_html=True)
+        payment_cards = "".join(
+            PAYMENT_CARD_TEMPLATE.format(
+                person=person,
+                amount=amount,
+                percentage=(amount / total_bill) * 100 if total_bill > 0 else 0,
+            )
+            for person, amount in splits.items()
+        )
+        st.markdown(payment_cards, unsafe_allow_html=True)
         
         # NEW: Detailed breakdown section
         st.markdown("---")
         st.markdown("### 📋 Detailed Split Breakdown")
         
+        sharer_names_by_item = _sharer_names_by_item(parsed_data['persons'], parsed_data['item_shares'])
+        
         with st.expander("🔍 View Detailed Calculation", expanded=False):
             # Show items and who shared them
             st.markdown("#### 🛒 Items & Sharing:")
             for item in parsed_data['items']:
                 item_name = item['name']
                 item_price = item['price']
-                sharers = parsed_data['item_shares'].get(item_name, [])
-                sharer_names = [parsed_data['persons'].get(abbr, abbr) for abbr in sharers]
-                st.markdown(f"• **{item_name}**: ${item_price:.2f} (shared by: {', '.join(sharer_names)})")
+                st.markdown(f"• **{item_name}**: ${item_price:.2f} (shared by: {sharer_names_by_item.get(item_name, '')})")
             
             st.markdown("#### 💳 Fee Distribution:")
             st.markdown(f"• **Tax**: ${parsed_data['fees'].get('Tax', 0):.2f} (distributed proportionally)")
@@ -462,41 +605,21 @@ elif st.session_state.step == 3:
         
         with col1:
             # Simple copy button
-            summary_text = "\n".join([f"{person}: ${amount:.2f}" for person, amount in splits.items()])
             if st.button("📋 Copy Simple Summary"):
-                st.code(summary_text)
+                st.code(_simple_summary(st.session_state.structured_output))
         
         with col2:
             # Detailed copy button
             if st.button("📋 Copy Summary with Details"):
-                detailed_summary = f"""Bill Split Summary
-==================
-
-WHO PAYS WHAT:
-{chr(10).join([f"{person}: ${amount:.2f} ({(amount/total_bill)*100:.1f}%)" for person, amount in splits.items()])}
-
-TOTAL: ${total_bill:.2f}
-
-DETAILED BREAKDOWN:
-==================
-
-ITEMS & SHARING:
-{chr(10).join([f"• {item['name']}: ${item['price']:.2f} (shared by: {', '.join([parsed_data['persons'].get(abbr, abbr) for abbr in parsed_data['item_shares'].get(item['name'], [])])})" for item in parsed_data['items']])}
-
-FEES:
-• Tax: ${parsed_data['fees'].get('Tax', 0):.2f} (distributed proportionally)
-• Delivery Fee: ${parsed_data['fees'].get('Delivery Fee', 0):.2f} (split equally)
-• Tip: ${parsed_data['fees'].get('Tip', 0):.2f} (split equally)
-
-Generated by Smart Bill Splitter AI"""
+                detailed_summary = _detailed_summary(st.session_state.structured_output)
                 
                 st.code(detailed_summary)
         
         # Start over button
         st.markdown("---")
         if st.button("🔄 Calculate Another Bill"):
-            for key in list(st.session_state.keys()):
-                del st.session_state[key]
+            for key in SESSION_KEYS:
+                st.session_state.pop(key, None)
             st.rerun()
     
     else:
@@ -516,31 +639,27 @@ elif st.session_state.step == 4:
         height=100
     )
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        if st.button("🔄 Regenerate with Feedback") and feedback.strip():
-            with st.spinner("🤖 Regenerating structured data with your feedback..."):
-                try:
-                    structured_object, structured_output = call_llm_api_sync(
-                        image_bytes_list=st.session_state.image_bytes_list,  # Use multiple images
-                        user_description=st.session_state.user_description,
-                        feedback=feedback,
-                        previous_output=st.session_state.structured_output
-                    )
-                    if structured_object and structured_output:
-                        st.session_state.structured_object = structured_object
-                        st.session_state.structured_output = structured_output
-                        st.session_state.step = 2
-                        st.success("✅ Results regenerated successfully!")
-                        time.sleep(1)
-                        st.rerun()
-                    else:
-                        st.error("❌ Failed to regenerate. Please try again.")
-                except Exception as e:
-                    st.error(f"❌ Error regenerating: {str(e)}")
+    regeneration_error = st.session_state.pop("regeneration_error", None)
+    if regeneration_error:
+        st.error(regeneration_error)
     
-    with col2:
-        if st.button("← Go Back"):
-            st.session_state.step = 2
-            st.rerun()
+    if st.session_state.get("regeneration") is not None:
+        poll_regeneration()
+    else:
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            if st.button("🔄 Regenerate with Feedback") and feedback.strip():
+                # Runs on the LLM event loop thread; poll_regeneration picks up the result
+                st.session_state.regeneration = submit_llm_api(
+                    image_bytes_list=st.session_state.image_bytes_list,  # Use multiple images
+                    user_description=st.session_state.user_description,
+                    feedback=feedback,
+                    previous_output=st.session_state.structured_output
+                )
+                st.rerun()
+        
+        with col2:
+            if st.button("← Go Back"):
+                st.session_state.step = 2
+                st.rerun()
@@ -1,10 +1,71 @@
+import copy
 import re
+import sys
+from functools import lru_cache
+from math import fsum
+
+import numpy as np
+
+_SECTION_HEADERS = (
+    ('persons', '--- PERSONS ---\n'),
+    ('items', '\n--- ITEMS ---\n'),
+    ('fees', '\n--- FEES ---\n'),
+    ('shares', '\n--- SHARES ---\n'),
+)
+
+def _split_sections(input_string):
+    """
+    Splits the input string into its four sections in a single left-to-right pass.
+
+    Returns:
+        A dictionary {'persons': str, 'items': str, 'fees': str, 'shares': str}
+        with the raw body of each section, or None if any header is missing.
+    """
+    sections = {}
+    # Skip everything up to and including the PERSONS header
+    _, found, remainder = input_string.partition(_SECTION_HEADERS[0][1])
+    if not found:
+        return None
+
+    # Each following header terminates the body of the previous section
+    for (name, _), (_, next_header) in zip(_SECTION_HEADERS, _SECTION_HEADERS[1:]):
+        body, found, remainder = remainder.partition(next_header)
+        if not found:
+            return None
+        sections[name] = body
+
+    sections[_SECTION_HEADERS[-1][0]] = remainder
+    return sections
+
+# "key: value" with both sides stripped; the key ends at the first colon
+_KV_RE = re.compile(r'\s*([^:]*?)\s*:\s*(.*?)\s*$')
+
+# Casefolded fee name -> canonical key used in parsed_data['fees']
+_EXPECTED_FEES = {'tax': 'Tax', 'delivery fee': 'Delivery Fee', 'tip': 'Tip'}
+
+def _iter_kv(section_body, kind, messages):
+    """
+    Yields (key, value, line) for each "key: value" line of a section body.
+
+    Blank lines are skipped silently, other lines without a colon add a warning to messages.
+    """
+    for line in section_body.split('\n'):
+        match = _KV_RE.match(line)
+        if match:
+            yield match.group(1), match.group(2), line
+        elif line.strip():
+             messages.append(f"Warning: Skipping malformed {kind} line: {line}")
 
 def parse_bill_input(input_string):
     """
     Parses the input string containing person abbreviations, item details, fees,
     and item-sharing information using abbreviations.
 
+    Results are memoized on the raw input string, so re-parsing the same
+    structured output (e.g. on every Streamlit rerun of the split step) is a
+    dictionary lookup. Each call returns its own copy of the parsed data and
+    prints the same warnings, cache hits included.
+
     Args:
         input_string: A multiline string in the specified format.
 
@@ -16,97 +77,99 @@ def parse_bill_input(input_string):
          'item_shares': {item_name: [abbr, ...], ...}}
         Returns None if parsing fails critically.
     """
-    persons_section = re.search(r'--- PERSONS ---\n(.*?)\n--- ITEMS ---', input_string, re.DOTALL)
-    items_section = re.search(r'--- ITEMS ---\n(.*?)\n--- FEES ---', input_string, re.DOTALL)
-    fees_section = re.search(r'--- FEES ---\n(.*?)\n--- SHARES ---', input_string, re.DOTALL)
-    shares_section = re.search(r'--- SHARES ---\n(.*)', input_string, re.DOTALL)
+    parsed_data, report = _parse_bill_input_cached(input_string)
+    # Warnings and errors are printed in one write instead of once per line
+    if report:
+        print(report)
+    if parsed_data is None:
+        return None
+    return copy.deepcopy(parsed_data)
 
-    if not all([persons_section, items_section, fees_section, shares_section]):
-        print("Error: Could not find all required sections (--- PERSONS ---, --- ITEMS ---, --- FEES ---, --- SHARES ---).")
+@lru_cache(maxsize=256)
+def _parse_bill_input_cached(input_string):
+    """
+    Cached implementation of parse_bill_input.
+
+    Returns (parsed_data, report), where report holds the newline-joined warnings
+    and errors. The returned dict is shared, do not mutate it.
+    """
+    messages = []
+    parsed_data = _parse_sections(input_string, messages)
+    return parsed_data, "\n".join(messages)
+
+def _parse_sections(input_string, messages):
+    """Parses input_string, appending any warnings and errors to messages."""
+    sections = _split_sections(input_string)
+
+    if sections is None:
+        messages.append("Error: Could not find all required sections (--- PERSONS ---, --- ITEMS ---, --- FEES ---, --- SHARES ---).")
         return None
 
     parsed_data = {'persons': {}, 'items': [], 'fees': {}, 'item_shares': {}}
 
     # Parse Persons
-    for line in persons_section.group(1).strip().split('\n'):
-        if ':' in line:
-            abbr, full_name = line.split(':', 1)
-            parsed_data['persons'][abbr.strip()] = full_name.strip()
-        elif line.strip():
-             print(f"Warning: Skipping malformed person line: {line}")
+    for abbr, full_name, _ in _iter_kv(sections['persons'], 'person', messages):
+        parsed_data['persons'][sys.intern(abbr)] = full_name
 
     if not parsed_data['persons']:
-        print("Error: No persons defined in --- PERSONS --- section.")
+        messages.append("Error: No persons defined in --- PERSONS --- section.")
         return None
 
     # Parse Items
-    for line in items_section.group(1).strip().split('\n'):
-        if ':' in line:
-            name, price_str = line.split(':', 1)
+    for name, price_str, line in _iter_kv(sections['items'], 'item', messages):
+        try:
+            parsed_data['items'].append({'name': sys.intern(name), 'price': float(price_str)})
+        except ValueError:
+            messages.append(f"Error parsing item price: {line}")
+            return None
+
+    if not parsed_data['items']:
+         messages.append("Warning: No items found in --- ITEMS --- section.")
+
+
+    # Parse Fees (names matched case-insensitively, stored under the canonical name)
+    for fee_name, amount_str, line in _iter_kv(sections['fees'], 'fee', messages):
+        canonical = _EXPECTED_FEES.get(fee_name.casefold())
+        if canonical is not None:
             try:
-                parsed_data['items'].append({'name': name.strip(), 'price': float(price_str.strip())})
+                parsed_data['fees'][canonical] = float(amount_str)
             except ValueError:
-                print(f"Error parsing item price: {line}")
+                messages.append(f"Error parsing fee amount for {canonical}: {line}")
                 return None
-        elif line.strip():
-             print(f"Warning: Skipping malformed item line: {line}")
-
-    if not parsed_data['items']:
-         print("Warning: No items found in --- ITEMS --- section.")
-
-
-    # Parse Fees
-    expected_fees = ['Tax', 'Delivery Fee', 'Tip']
-    for line in fees_section.group(1).strip().split('\n'):
-        if ':' in line:
-            fee_name, amount_str = line.split(':', 1)
-            fee_name = fee_name.strip()
-            if fee_name in expected_fees:
-                try:
-                    parsed_data['fees'][fee_name] = float(amount_str.strip())
-                except ValueError:
-                    print(f"Error parsing fee amount for {fee_name}: {line}")
-                    return None
-            else:
-                 print(f"Warning: Skipping unexpected fee line: {line}")
-        elif line.strip():
-             print(f"Warning: Skipping malformed fee line: {line}")
+        else:
+             messages.append(f"Warning: Skipping unexpected fee line: {line}")
 
     # Check if all expected fees were found
-    for fee in expected_fees:
+    for fee in _EXPECTED_FEES.values():
         if fee not in parsed_data['fees']:
-            print(f"Warning: Fee '{fee}' not found in input. Assuming 0.00.")
+            messages.append(f"Warning: Fee '{fee}' not found in input. Assuming 0.00.")
             parsed_data['fees'][fee] = 0.0
 
     # Parse Shares (Item -> List of Abbrs)
     all_item_names = {item['name'] for item in parsed_data['items']}
     all_person_abbrs = set(parsed_data['persons'].keys())
 
-    for line in shares_section.group(1).strip().split('\n'):
-        if ':' in line:
-            item_name, abbrs_str = line.split(':', 1)
-            item_name = item_name.strip()
-            abbr_list = [abbr.strip() for abbr in abbrs_str.split(',') if abbr.strip()]
-
-            if item_name not in all_item_names:
-                print(f"Warning: Item '{item_name}' in SHARES section not found in ITEMS.")
-                continue # Skip this share line if item doesn't exist
-
-            # Validate abbreviations in shares
-            valid_abbrs = []
-            for abbr in abbr_list:
-                if abbr in all_person_abbrs:
-                    valid_abbrs.append(abbr)
-                else:
-                    print(f"Warning: Unknown person abbreviation '{abbr}' found for item '{item_name}'. Skipping.")
-
-            if valid_abbrs:
-                 parsed_data['item_shares'][item_name] = valid_abbrs
-            else:
-                 print(f"Warning: No valid sharers found for item '{item_name}'. This item cost will not be allocated.")
+    # Names are interned so share lists and lookups reuse the PERSONS/ITEMS string objects
+    for item_name, abbrs_str, _ in _iter_kv(sections['shares'], 'shares', messages):
+        item_name = sys.intern(item_name)
+        abbr_list = [sys.intern(abbr.strip()) for abbr in abbrs_str.split(',') if abbr.strip()]
 
-        elif line.strip():
-             print(f"Warning: Skipping malformed shares line: {line}")
+        if item_name not in all_item_names:
+            messages.append(f"Warning: Item '{item_name}' in SHARES section not found in ITEMS.")
+            continue # Skip this share line if item doesn't exist
+
+        # Validate abbreviations in shares
+        invalid_abbrs = set(abbr_list) - all_person_abbrs
+        valid_abbrs = [abbr for abbr in abbr_list if abbr not in invalid_abbrs] if invalid_abbrs else abbr_list
+        if invalid_abbrs:
+            for abbr in dict.fromkeys(abbr_list): # Warn in input order, once per abbreviation
+                if abbr in invalid_abbrs:
+                    messages.append(f"Warning: Unknown person abbreviation '{abbr}' found for item '{item_name}'. Skipping.")
+
+        if valid_abbrs:
+             parsed_data['item_shares'][item_name] = valid_abbrs
+        else:
+             messages.append(f"Warning: No valid sharers found for item '{item_name}'. This item cost will not be allocated.")
 
     return parsed_data
 
@@ -129,40 +192,47 @@ def split_instacart_bill(persons_map, items, fees, item_shares):
 
     # Get the list of all full person names involved (from the PERSONS section)
     all_people = list(persons_map.values())
-    all_person_abbrs = set(persons_map.keys()) # Need set for quick lookup
+    person_idx = {full_name: i for i, full_name in enumerate(dict.fromkeys(all_people))}
+    abbr_to_idx = {abbr: person_idx[full_name] for abbr, full_name in persons_map.items()}
 
     # 1. Calculate each person's share of the item costs
-    # This time, iterate through items first
-    person_item_cost_shares = {full_name: 0.0 for full_name in all_people}
-    total_shared_item_cost = 0.0 # Sum of costs of items that were actually shared
-
+    # Only items with a positive price and at least one sharer are allocated
+    shared_items = []
     for item_name, sharer_abbrs in item_shares.items():
         item_price = item_price_lookup.get(item_name, 0.0) # Use .get for safety
-        num_sharers = len(sharer_abbrs)
-
-        if num_sharers > 0 and item_price > 0:
-             cost_per_sharer = item_price / num_sharers
-             total_shared_item_cost += item_price # Add full item price to total shared cost
-             for abbr in sharer_abbrs:
-                 full_name = persons_map.get(abbr) # Get full name from abbr
-                 if full_name: # Make sure abbr was valid
-                      person_item_cost_shares[full_name] += cost_per_sharer
-                 # else: Warning was already printed in parse_bill_input
-
+        if len(sharer_abbrs) > 0 and item_price > 0:
+            shared_items.append((item_price, sharer_abbrs))
+
+    # share_matrix[p, i] is the fraction of shared item i paid by person p
+    prices = np.array([item_price for item_price, _ in shared_items], dtype=np.float64)
+    share_matrix = np.zeros((len(person_idx), len(shared_items)), dtype=np.float64)
+    for i, (_, sharer_abbrs) in enumerate(shared_items):
+        cost_fraction = 1.0 / len(sharer_abbrs)
+        for abbr in sharer_abbrs:
+            p = abbr_to_idx.get(abbr)
+            if p is not None: # Make sure abbr was valid
+                share_matrix[p, i] += cost_fraction
+            # else: Warning was already printed in parse_bill_input
+
+    item_cost_shares = share_matrix @ prices
+    total_shared_item_cost = float(prices.sum()) # Sum of costs of items that were actually shared
+
+    # Per-person shares live in one (3, num_unique_people) array indexed by person_idx:
+    # row 0 item share, row 1 tax share, row 2 delivery/tip share
+    person_shares = np.zeros((3, len(person_idx)), dtype=np.float64)
+    person_shares[0] = item_cost_shares
 
     # 2. Calculate total tax and tax share per person
     total_tax = fees.get('Tax', 0.0)
-    person_tax_shares = {full_name: 0.0 for full_name in all_people}
 
     # Tax is proportional to the person's share of the total cost of the *shared* items
-    # The sum of person_item_cost_shares should equal total_shared_item_cost
+    # The sum of the item shares should equal total_shared_item_cost
     # Note: total_item_cost (sum of *all* items) is not used for tax proportionality here,
     # only the sum of items that actually had sharers assigned.
     # If tax applies to the *entire* bill including items nobody claimed, the logic needs adjustment.
     # Assuming tax only applies to items claimed/shared:
     if total_shared_item_cost > 0:
-         for full_name, item_cost_share in person_item_cost_shares.items():
-            person_tax_shares[full_name] = (item_cost_share / total_shared_item_cost) * total_tax
+        person_shares[1] = item_cost_shares * (total_tax / total_shared_item_cost)
     elif total_tax > 0:
          print("Warning: Total cost of shared items is 0, but total tax is non-zero. Tax is not allocated proportionally.")
 
@@ -171,16 +241,18 @@ def split_instacart_bill(persons_map, items, fees, item_shares):
     total_other_fees = fees.get('Delivery Fee', 0.0) + fees.get('Tip', 0.0)
     num_people = len(all_people) # Use the count from the PERSONS section
     equal_fee_share = total_other_fees / num_people if num_people > 0 else 0
+    person_shares[2] = equal_fee_share # Everyone pays the same share of other fees
 
-    # 4. Calculate total bill for each person
+    # 4. Calculate total bill for each person in one pass over the share rows
+    bill_totals = (person_shares[0] + person_shares[1] + person_shares[2]).tolist()
+    share_columns = person_shares.T.tolist()
     person_total_bills = {}
     print("\n--- Bill Breakdown ---")
     for full_name in all_people:
-        item_share = person_item_cost_shares.get(full_name, 0.0)
-        tax_share = person_tax_shares.get(full_name, 0.0)
-        fees_share = equal_fee_share # Everyone pays the same share of other fees
+        p = person_idx[full_name]
+        item_share, tax_share, fees_share = share_columns[p]
 
-        total_bill = item_share + tax_share + fees_share
+        total_bill = bill_totals[p]
         person_total_bills[full_name] = total_bill
 
         print(f"{full_name}:")
@@ -192,10 +264,10 @@ def split_instacart_bill(persons_map, items, fees, item_shares):
 
 
     # Optional: Verification
-    # The sum of person_item_cost_shares + tax + other fees should equal the original total
-    original_total_item_cost = sum(item['price'] for item in items)
+    # The sum of the item shares + tax + other fees should equal the original total
+    original_total_item_cost = fsum(item['price'] for item in items)
     original_total_bill = original_total_item_cost + total_tax + total_other_fees
-    calculated_total_bill = sum(person_total_bills.values())
+    calculated_total_bill = fsum(person_total_bills.values())
 
     print(f"Calculated Total Bill: ${calculated_total_bill:.2f}")
     print(f"Original Total Bill:   ${original_total_bill:.2f}")
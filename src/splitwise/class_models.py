@@ -1,6 +1,7 @@
 from dataclasses import dataclass
+from math import fsum
 from typing import Optional, Dict, Any, List
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 @dataclass
@@ -13,12 +14,16 @@ class DependencySplitwiseDeps:
 
 class FeeItem(BaseModel):
     """Individual fee or discount item."""
+    model_config = ConfigDict(frozen=True)
+
     name: str
     amount: float
     category: str  # "Tax", "Delivery Fee", or "Tip"
 
 class FeeCategorization(BaseModel):
     """Categorized fees before aggregation."""
+    model_config = ConfigDict(frozen=True)
+
     tax_items: List[FeeItem]
     delivery_items: List[FeeItem] 
     tip_items: List[FeeItem]
@@ -26,9 +31,9 @@ class FeeCategorization(BaseModel):
     def calculate_totals(self) -> Dict[str, float]:
         """Calculate total for each category."""
         return {
-            "Tax": sum(item.amount for item in self.tax_items),
-            "Delivery Fee": sum(item.amount for item in self.delivery_items),
-            "Tip": sum(item.amount for item in self.tip_items)
+            "Tax": fsum(item.amount for item in self.tax_items),
+            "Delivery Fee": fsum(item.amount for item in self.delivery_items),
+            "Tip": fsum(item.amount for item in self.tip_items)
         }
 
 class SplitwiseFormattedOutput(BaseModel):
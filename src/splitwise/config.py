@@ -1,3 +1,7 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,4 +14,36 @@ AZURE_CONFIG = {
         "default_version": "2024-12-01-preview",
         "deployment_name": "gpt-4o",
     },
-}
\ No newline at end of file
+}
+
+
+@dataclass(frozen=True)
+class AzureModelConfig:
+    """AZURE_CONFIG entry with its environment variables already resolved."""
+    endpoint: Optional[str]
+    api_key: Optional[str]
+    api_version: str
+    deployment_name: str
+
+# Resolved once at import, after load_dotenv(), so building a model reads no env vars
+AZURE_MODELS = {
+    model_name: AzureModelConfig(
+        endpoint=os.getenv(config["endpoint_env"]),
+        api_key=os.getenv(config["key_env"]),
+        api_version=os.getenv(config["version_env"], config["default_version"]),
+        deployment_name=config["deployment_name"],
+    )
+    for model_name, config in AZURE_CONFIG.items()
+}
+
+# Client-side pacing for LLM calls, sized to the deployment quota
+LLM_RATE_LIMIT = {
+    "requests_per_minute": int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+    "max_inflight": int(os.getenv("LLM_MAX_INFLIGHT", "4")),
+}
+
+# Largest accepted receipt image upload
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))
+
+# Longest side, in pixels, of images sent to the LLM; larger photos are downscaled first
+MAX_IMAGE_DIMENSION = int(os.getenv("MAX_IMAGE_DIMENSION", "1600"))
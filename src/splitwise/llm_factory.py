@@ -1,47 +1,58 @@
-import os
 from enum import Enum
-from typing import Dict, Tuple
+from functools import lru_cache
+from typing import Optional, Tuple
+import httpx
 from loguru import logger
-from dotenv import load_dotenv
 from openai import AsyncAzureOpenAI
 from pydantic_ai.models.openai import OpenAIModel
 from pydantic_ai.providers.openai import OpenAIProvider
 
-from src.splitwise.config import AZURE_CONFIG
-
-load_dotenv()
+from src.splitwise.config import AZURE_MODELS
 
 
 class LLMProviderType(Enum):
     AZURE_OPENAI = "azure_openai"
 
-_client_cache: Dict[str, OpenAIProvider] = {} # cache for Azure OpenAI clients
-_model_cache: Dict[str, OpenAIModel] = {} # cache for LLM models
+_http_client: Optional[httpx.AsyncClient] = None # connection pool shared by all clients
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Creates or retrieves the shared httpx.AsyncClient used by every Azure OpenAI client."""
 
+    global _http_client
+    if _http_client is None:
+        logger.info("Creating shared HTTP client for LLM requests")
+        # Retries here only cover failed TCP/TLS connects; the OpenAI SDK retries 429s and 5xx itself.
+        # HTTP/2 lets the parser and categorizer calls of concurrent sessions share one connection.
+        _http_client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=16, keepalive_expiry=60),
+                retries=2,
+                http2=True,
+            ),
+        )
+    return _http_client
+
+@lru_cache(maxsize=16)
 def _get_azure_client(
         endpoint: str, api_key: str,
         api_version: str
 ) -> AsyncAzureOpenAI:
-    """Creates or retrieves a chached AsyncAzureOpenAI client."""
+    """Creates an AsyncAzureOpenAI client, cached per (endpoint, api_key, api_version)."""
 
-    client_key = f"{endpoint}:{api_version}"
-    if client_key not in _client_cache:
-        logger.info(f"Creating new AsyncAzureOpenAI client for endpoint: {endpoint}")
-        if not endpoint or not api_key:
-            raise ValueError("Endpoint or API key are missing, both must be provided.")
-        
-        try:
-            _client_cache[client_key] = AsyncAzureOpenAI(
-                azure_endpoint=endpoint,
-                api_key=api_key,
-                api_version=api_version,
-            )
-        except Exception as e:
-            logger.error(f"Failed to create AsyncAzureOpenAI client: {e}")
-            raise
-    else:
-        logger.info(f"Using cached AsyncAzureOpenAI client for endpoint: {endpoint}")
-    return _client_cache[client_key]
+    logger.info(f"Creating new AsyncAzureOpenAI client for endpoint: {endpoint}")
+    if not endpoint or not api_key:
+        raise ValueError("Endpoint or API key are missing, both must be provided.")
+    
+    try:
+        return AsyncAzureOpenAI(
+            azure_endpoint=endpoint,
+            api_key=api_key,
+            api_version=api_version,
+            http_client=_get_http_client(),
+        )
+    except Exception as e:
+        logger.error(f"Failed to create AsyncAzureOpenAI client: {e}")
+        raise
 
 def get_model(
         model_name: str,
@@ -53,41 +64,50 @@ def get_model(
     Args:
         model_name (str): Logical name or deployment name of the model to retrieve. Must match a key in the AZURE_CONFIG
         provider_type (LLMProviderType): The type of LLM provider (instance of LLMProviderType).
-        **kwargs: Additional arguments for the model."""
+        **kwargs: Additional arguments for the model. Models built with kwargs (which may
+            be unhashable, e.g. a settings dict) are not cached; they still share the cached
+            Azure client."""
     
     if not isinstance(provider_type, LLMProviderType):
         raise ValueError("provider_type must be an instance of LLMProviderType.")
     
+    if kwargs:
+        return _create_model(model_name, provider_type, **kwargs)
+    return _build_model(model_name, provider_type)
+
+@lru_cache(maxsize=None)
+def _build_model(model_name: str, provider_type: LLMProviderType) -> OpenAIModel:
+    """Creates the default model for get_model, cached per (model_name, provider_type)."""
+    return _create_model(model_name, provider_type)
+
+def _create_model(
+        model_name: str,
+        provider_type: LLMProviderType,
+        **kwargs,
+) -> OpenAIModel:
+    """Creates a new model instance for the given provider."""
+
     cache_key = f"{provider_type.value}:{model_name}"
-    if cache_key in _model_cache:
-        logger.info(f"Using cached model for {cache_key}")
-        return _model_cache[cache_key]
-    
     logger.info(f"Creating new model instance for key: {cache_key}")
 
     # provider specific logic
     if provider_type == LLMProviderType.AZURE_OPENAI:
-        if model_name not in AZURE_CONFIG:
+        if model_name not in AZURE_MODELS:
             raise ValueError(f"Model {model_name} not found in AZURE_CONFIG.")
-        config = AZURE_CONFIG[model_name]
-        endpoint = os.getenv(config["endpoint_env"])
-        api_key = os.getenv(config["key_env"])
-        api_version = os.getenv(config["version_env"], config["default_version"])
-        deployment_name = config["deployment_name"]
+        config = AZURE_MODELS[model_name]
 
-        if not endpoint or not api_key:
+        if not config.endpoint or not config.api_key:
             raise ValueError("Endpoint or API key are missing, both must be provided.")
         
-        client = _get_azure_client(endpoint=endpoint, api_key=api_key, api_version=api_version)
+        client = _get_azure_client(endpoint=config.endpoint, api_key=config.api_key, api_version=config.api_version)
 
         provider_instance = OpenAIProvider(openai_client=client)
 
         model_instance = OpenAIModel(
-            deployment_name, provider=provider_instance, **kwargs
+            config.deployment_name, provider=provider_instance, **kwargs
         )
 
-        _model_cache[cache_key] = model_instance
-        logger.info(f"Successfully created and cached model instance for {cache_key}")
+        logger.info(f"Successfully created model instance for {cache_key}")
         return model_instance
     
     else:
@@ -1,25 +1,36 @@
 """LLM API integration for bill processing"""
-from typing import Optional, List, Tuple, Union
+import asyncio
+import concurrent.futures
+import hashlib
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Optional, List, Tuple, Union
 from pydantic_ai import Agent, RunContext, BinaryContent
 from pydantic_ai.messages import ModelMessage
+from src.splitwise.config import LLM_RATE_LIMIT
 from src.splitwise.llm_factory import get_model, LLMProviderType
+from src.splitwise.rate_limiter import AsyncRateLimiter
+from src.splitwise.utils import sniff_image_type
 from src.splitwise.class_models import DependencySplitwiseDeps, SplitwiseFormattedOutput, FeeCategorization, FeeItem
 
-try:
-    llm_model = get_model(
-        model_name="gpt-4o", provider_type=LLMProviderType.AZURE_OPENAI
-    )
-except Exception as e:
-    print(f"FATAL ERROR: Could not initialize LLM model: {e}")
-    raise SystemExit(f"Failed to load the LLM model: {e}")
-
-# Agent 1: Bill Parser - Extract items, people, and raw fees
-bill_parser_agent = Agent(
-    llm_model,
-    output_type=SplitwiseFormattedOutput,
-    output_retries=3,
-    deps_type=DependencySplitwiseDeps
-)
+# Shared by both agents so the deployment quota is enforced across all sessions
+llm_rate_limiter = AsyncRateLimiter(**LLM_RATE_LIMIT)
+
+async def _run_agent(agent: Agent, *args, **kwargs):
+    """Run an agent call under the shared client-side rate limit."""
+    async with llm_rate_limiter:
+        return await agent.run(*args, **kwargs)
+
+# LRU cache of successful results for identical (images, description) submissions
+_RESULT_CACHE_SIZE = 128
+_result_cache: "OrderedDict[bytes, Tuple[SplitwiseFormattedOutput, str]]" = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+def _result_cache_key(image_bytes_list: List[bytes], user_description: str) -> bytes:
+    """Hash of the per-image SHA-256 digests plus the split description."""
+    digests = b"".join(hashlib.sha256(image_bytes).digest() for image_bytes in image_bytes_list)
+    return hashlib.sha256(digests + user_description.encode("utf-8")).digest()
 
 # Update bill parser prompt for multiple images
 bill_parser_prompt = """
@@ -52,18 +63,9 @@ Return structured data with:
 Focus on accuracy of extraction, not categorization. Combine information from all images intelligently.
 """
 
-@bill_parser_agent.instructions
 def bill_parser_system_prompt(ctx: RunContext[DependencySplitwiseDeps]):
     return bill_parser_prompt
 
-# Agent 2: Fee Categorizer - Categorize extracted fees
-fee_categorizer_agent = Agent(
-    llm_model,
-    output_type=FeeCategorization,
-    output_retries=3,
-    deps_type=List[FeeItem]  # Takes list of fees as input
-)
-
 fee_categorizer_prompt = """
 You are a fee categorization specialist.
 
@@ -94,19 +96,104 @@ Examples:
 Return FeeCategorization object with the EXACT SAME fees distributed across tax_items, delivery_items, and tip_items.
 """
 
-@fee_categorizer_agent.instructions  
+# Static part of the categorizer instructions, only the fee list is formatted per call
+fee_categorizer_prompt_prefix = f"""{fee_categorizer_prompt}
+
+FEES TO CATEGORIZE"""
+
 def fee_categorizer_system_prompt(ctx: RunContext[List[FeeItem]]):
     fees_list = ctx.deps
-    fee_details = "\n".join([f"- {fee.name}: ${fee.amount:.2f}" for fee in fees_list])
+    fee_details = "\n".join(f"- {fee.name}: ${fee.amount:.2f}" for fee in fees_list)
     
-    return f"""{fee_categorizer_prompt}
-
-FEES TO CATEGORIZE (exactly {len(fees_list)} fees):
+    return f"""{fee_categorizer_prompt_prefix} (exactly {len(fees_list)} fees):
 {fee_details}
 
 You must categorize exactly these {len(fees_list)} fees and no others.
 """
 
+# Keyword rules from fee_categorizer_prompt, matched on whole words of the fee name
+_FEE_WORD_RE = re.compile(r"[a-z]+")
+_DELIVERY_KEYWORDS = frozenset(("delivery", "shipping", "transport", "courier"))
+_TIP_KEYWORDS = frozenset(("tip", "gratuity"))
+_TAX_KEYWORDS = frozenset(("tax", "vat"))
+
+def _rule_categorize(fee: FeeItem) -> Optional[str]:
+    """Category for an unambiguous fee name, or None if the LLM should decide."""
+    words = _FEE_WORD_RE.findall(fee.name.lower())
+    is_delivery = not _DELIVERY_KEYWORDS.isdisjoint(words)
+    is_tip = not _TIP_KEYWORDS.isdisjoint(words)
+    if is_delivery and is_tip:
+        return None
+    if is_delivery:
+        return "Delivery Fee"
+    if is_tip:
+        return "Tip"
+    if not _TAX_KEYWORDS.isdisjoint(words):
+        return "Tax"
+    return None
+
+def _rule_categorize_fees(fees: List[FeeItem]) -> Optional[FeeCategorization]:
+    """
+    Categorize fees with the keyword rules alone
+    
+    Returns:
+        FeeCategorization if every fee matched exactly one rule, otherwise None
+    """
+    buckets: Dict[str, List[FeeItem]] = {"Tax": [], "Delivery Fee": [], "Tip": []}
+    for fee in fees:
+        category = _rule_categorize(fee)
+        if category is None:
+            return None
+        buckets[category].append(fee.model_copy(update={"category": category}))
+    return FeeCategorization(
+        tax_items=buckets["Tax"],
+        delivery_items=buckets["Delivery Fee"],
+        tip_items=buckets["Tip"],
+    )
+
+_agents: Optional[Tuple[Agent, Agent]] = None # (bill_parser_agent, fee_categorizer_agent)
+_agents_lock = threading.Lock()
+
+def get_agents() -> Tuple[Agent, Agent]:
+    """
+    Returns the (bill_parser_agent, fee_categorizer_agent) pair, creating it on first use
+    
+    Building the agents resolves the Azure model, so this is deferred until the first
+    bill is processed instead of running when the module is imported.
+    
+    Raises:
+        ValueError: If the model configuration or credentials are missing
+    """
+    
+    global _agents
+    if _agents is None:
+        with _agents_lock:
+            if _agents is None:
+                llm_model = get_model(
+                    model_name="gpt-4o", provider_type=LLMProviderType.AZURE_OPENAI
+                )
+                
+                # Agent 1: Bill Parser - Extract items, people, and raw fees
+                bill_parser_agent = Agent(
+                    llm_model,
+                    output_type=SplitwiseFormattedOutput,
+                    output_retries=3,
+                    deps_type=DependencySplitwiseDeps
+                )
+                bill_parser_agent.instructions(bill_parser_system_prompt)
+                
+                # Agent 2: Fee Categorizer - Categorize extracted fees
+                fee_categorizer_agent = Agent(
+                    llm_model,
+                    output_type=FeeCategorization,
+                    output_retries=3,
+                    deps_type=List[FeeItem]  # Takes list of fees as input
+                )
+                fee_categorizer_agent.instructions(fee_categorizer_system_prompt)
+                
+                _agents = (bill_parser_agent, fee_categorizer_agent)
+    return _agents
+
 async def call_llm_api(image_bytes_list: Union[List[bytes], bytes], user_description: str, 
                       feedback: Optional[str] = None, 
                       previous_output: Optional[str] = None) -> Tuple[SplitwiseFormattedOutput, str]:
@@ -121,12 +208,38 @@ async def call_llm_api(image_bytes_list: Union[List[bytes], bytes], user_descrip
     
     Returns:
         Tuple[SplitwiseFormattedOutput, str]: (structured_object, formatted_string)
+    
+    Raises:
+        Exception: Any LLM or validation failure is propagated to the caller
+    
+    The work always runs on the background loop from _get_event_loop(), even when awaited
+    from another loop, because the rate limiter and the httpx pool are bound to that loop.
     """
+    return await _run_on_event_loop(
+        _call_llm_api(image_bytes_list, user_description, feedback, previous_output)
+    )
+
+async def _call_llm_api(image_bytes_list: Union[List[bytes], bytes], user_description: str,
+                        feedback: Optional[str] = None,
+                        previous_output: Optional[str] = None) -> Tuple[SplitwiseFormattedOutput, str]:
+    """Implementation of call_llm_api, must run on the background loop."""
     
     # Handle backward compatibility - convert single bytes to list
     if isinstance(image_bytes_list, bytes):
         image_bytes_list = [image_bytes_list]
     
+    # Feedback runs must always reach the LLM, only plain submissions are cached
+    cache_key = None
+    if feedback is None and previous_output is None:
+        cache_key = _result_cache_key(image_bytes_list, user_description)
+        with _result_cache_lock:
+            cached = _result_cache.get(cache_key)
+            if cached is not None:
+                _result_cache.move_to_end(cache_key)
+        if cached is not None:
+            print("Using cached result for identical receipt image(s) and description")
+            return cached[0].model_copy(deep=True), cached[1]
+    
     # Create dependency object for bill parser
     deps = DependencySplitwiseDeps(
         image_bytes_list=image_bytes_list,
@@ -136,6 +249,8 @@ async def call_llm_api(image_bytes_list: Union[List[bytes], bytes], user_descrip
     )
     
     try:
+        bill_parser_agent, fee_categorizer_agent = get_agents()
+        
         # Build the user prompt with feedback if provided
         num_images = len(image_bytes_list)
         user_prompt = f"Process these {num_images} receipt image(s) using the split description: {user_description}"
@@ -149,9 +264,11 @@ async def call_llm_api(image_bytes_list: Union[List[bytes], bytes], user_descrip
         # Create message list with user prompt and all images
         messages = [user_prompt]
         for i, image_bytes in enumerate(image_bytes_list):
-            messages.append(BinaryContent(data=image_bytes, media_type="image/png"))
+            media_type = sniff_image_type(image_bytes[:16]) or "image/png"
+            messages.append(BinaryContent(data=image_bytes, media_type=media_type))
         
-        bill_result = await bill_parser_agent.run(
+        bill_result = await _run_agent(
+            bill_parser_agent,
             messages,
             deps=deps,
         )
@@ -163,60 +280,156 @@ async def call_llm_api(image_bytes_list: Union[List[bytes], bytes], user_descrip
                        bill_data.raw_fees.delivery_items + 
                        bill_data.raw_fees.tip_items)
         
-        if all_raw_fees:
+        # Fees whose names all match a keyword rule don't need the categorizer round-trip
+        rule_categorization = _rule_categorize_fees(all_raw_fees) if all_raw_fees else None
+        if rule_categorization is not None:
+            bill_data.raw_fees = rule_categorization
+            print(f"Step 2: Categorized {len(all_raw_fees)} fees by keyword rules, skipping LLM categorization")
+        elif all_raw_fees:
             print(f"Step 2: Categorizing {len(all_raw_fees)} fees...")
             print(f"Fees to categorize: {[f'{fee.name}: ${fee.amount:.2f}' for fee in all_raw_fees]}")
             
-            categorization_result = await fee_categorizer_agent.run(
+            categorization_result = await _run_agent(
+                fee_categorizer_agent,
                 f"Categorize these {len(all_raw_fees)} fees according to the strict rules. Do not add or remove any fees.",
                 deps=all_raw_fees
             )
             
-            # Validate that no fees were added or removed
+            # Validate that no fees were added, removed, renamed or re-priced
             categorized_fees = (categorization_result.output.tax_items + 
                               categorization_result.output.delivery_items + 
                               categorization_result.output.tip_items)
+            input_fees = Counter((f.name, round(f.amount, 2)) for f in all_raw_fees)
+            output_fees = Counter((f.name, round(f.amount, 2)) for f in categorized_fees)
             
-            if len(categorized_fees) != len(all_raw_fees):
-                print(f"WARNING: Fee count mismatch! Input: {len(all_raw_fees)}, Output: {len(categorized_fees)}")
-                print(f"Input fees: {[f.name for f in all_raw_fees]}")
-                print(f"Output fees: {[f.name for f in categorized_fees]}")
+            if input_fees != output_fees:
+                print("WARNING: Fee mismatch between input and categorized fees!")
+                print(f"Missing from output: {list((input_fees - output_fees).elements())}")
+                print(f"Unexpected in output: {list((output_fees - input_fees).elements())}")
                 print("Falling back to original categorization...")
             else:
                 bill_data.raw_fees = categorization_result.output
                 print("Fee categorization successful!")
         
+        persons_section = "\n".join(f"{abbr}: {name}" for abbr, name in bill_data.persons.items())
+        items_section = "\n".join(f"{item['name']}: {item['price']}" for item in bill_data.items)
+        shares_section = "\n".join(f"{item}: {', '.join(sharers)}" for item, sharers in bill_data.item_shares.items())
+        
         # Step 3: Calculate totals using the model's method
         calculated_fees = bill_data.raw_fees.calculate_totals()
         bill_data.fees = calculated_fees
+        tax, delivery_fee, tip = calculated_fees['Tax'], calculated_fees['Delivery Fee'], calculated_fees['Tip']
         
         # Format as your bill parser expects
         formatted_output = f"""--- PERSONS ---
-{chr(10).join([f"{abbr}: {name}" for abbr, name in bill_data.persons.items()])}
+{persons_section}
 
 --- ITEMS ---
-{chr(10).join([f"{item['name']}: {item['price']}" for item in bill_data.items])}
+{items_section}
 
 --- FEES ---
-Tax: {calculated_fees['Tax']:.2f}
-Delivery Fee: {calculated_fees['Delivery Fee']:.2f}
-Tip: {calculated_fees['Tip']:.2f}
+Tax: {tax:.2f}
+Delivery Fee: {delivery_fee:.2f}
+Tip: {tip:.2f}
 
 --- SHARES ---
-{chr(10).join([f"{item}: {', '.join(sharers)}" for item, sharers in bill_data.item_shares.items()])}"""
+{shares_section}"""
+        
+        if cache_key is not None:
+            with _result_cache_lock:
+                _result_cache[cache_key] = (bill_data.model_copy(deep=True), formatted_output)
+                if len(_result_cache) > _RESULT_CACHE_SIZE:
+                    _result_cache.popitem(last=False)
         
         return bill_data, formatted_output
         
     except Exception as e:
         print(f"Error in two-agent processing: {e}")
-        error_msg = f"Error: Failed to process bill data - {str(e)}"
-        empty_object = SplitwiseFormattedOutput(
-            persons={}, items=[], fees={}, item_shares={}, 
-            raw_fees=FeeCategorization(tax_items=[], delivery_items=[], tip_items=[])
-        )
-        return empty_object, error_msg
+        raise
+
+async def call_llm_api_batch(bill_requests: List[Dict[str, Any]],
+                             max_concurrent: int = 5) -> List[Union[Tuple[SplitwiseFormattedOutput, str], BaseException]]:
+    """
+    Process several bills concurrently, keeping at most max_concurrent in flight
+    
+    Args:
+        bill_requests: List of keyword-argument dicts for call_llm_api
+                       (image_bytes_list, user_description, feedback, previous_output)
+        max_concurrent: Maximum number of bills processed at the same time
+    
+    Returns:
+        List of call_llm_api results (or raised exceptions), in the order of bill_requests
+    
+    Like call_llm_api, the batch runs on the background loop even when awaited from another loop.
+    """
+    return await _run_on_event_loop(_call_llm_api_batch(bill_requests, max_concurrent))
+
+async def _call_llm_api_batch(bill_requests: List[Dict[str, Any]],
+                              max_concurrent: int) -> List[Union[Tuple[SplitwiseFormattedOutput, str], BaseException]]:
+    """Implementation of call_llm_api_batch, must run on the background loop."""
+    semaphore = asyncio.Semaphore(max_concurrent)
+    
+    async def _process(kwargs: Dict[str, Any]) -> Tuple[SplitwiseFormattedOutput, str]:
+        async with semaphore:
+            return await call_llm_api(**kwargs)
+    
+    return await asyncio.gather(*(_process(kwargs) for kwargs in bill_requests), return_exceptions=True)
 
 # Keep the existing sync wrapper
+# All sync calls run on one long-lived event loop in a daemon thread. httpx connections
+# belong to the loop that opened them, so a fresh asyncio.run() per call could never reuse
+# the shared keep-alive pool and failed on its first pooled request with "Event loop is closed".
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_event_loop_lock = threading.Lock()
+
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+    """Start (once) and return the background event loop used by call_llm_api_sync."""
+    global _event_loop
+    if _event_loop is None:
+        with _event_loop_lock:
+            if _event_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+                _event_loop = loop
+    return _event_loop
+
+async def _run_on_event_loop(coro):
+    """Await coro on the background loop, handing it over when awaited from any other loop."""
+    loop = _get_event_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    # Cancelling the awaiting task also cancels the handed-over one
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+def submit_llm_api(image_bytes_list: Union[List[bytes], bytes], user_description: str,
+                   feedback: Optional[str] = None,
+                   previous_output: Optional[str] = None) -> concurrent.futures.Future:
+    """
+    Non-blocking variant of call_llm_api_sync: schedules call_llm_api on the background loop
+    
+    Returns:
+        concurrent.futures.Future: resolves to (structured_object, formatted_string).
+        Calling cancel() on it cancels the in-flight LLM requests.
+    """
+    return asyncio.run_coroutine_threadsafe(
+        call_llm_api(image_bytes_list, user_description, feedback, previous_output),
+        _get_event_loop(),
+    )
+
+def submit_llm_api_batch(bill_requests: List[Dict[str, Any]],
+                         max_concurrent: int = 5) -> concurrent.futures.Future:
+    """
+    Non-blocking variant of call_llm_api_batch: schedules the batch on the background loop
+    
+    Returns:
+        concurrent.futures.Future: resolves to the call_llm_api_batch result list.
+        Calling cancel() on it cancels every bill still in flight.
+    """
+    return asyncio.run_coroutine_threadsafe(
+        _call_llm_api_batch(bill_requests, max_concurrent),
+        _get_event_loop(),
+    )
+
 def call_llm_api_sync(image_bytes_list: Union[List[bytes], bytes], user_description: str, 
                      feedback: Optional[str] = None, 
                      previous_output: Optional[str] = None) -> Tuple[SplitwiseFormattedOutput, str]:
@@ -225,26 +438,13 @@ def call_llm_api_sync(image_bytes_list: Union[List[bytes], bytes], user_descript
     
     Returns:
         Tuple[SplitwiseFormattedOutput, str]: (structured_object, formatted_string)
+    
+    Raises:
+        Exception: Propagated from call_llm_api
     """
     
     try:
-        # Check if we're already in an event loop
-        try:
-            import asyncio
-            loop = asyncio.get_running_loop()
-            # We're in an event loop, use asyncio.create_task
-            import nest_asyncio
-            nest_asyncio.apply()
-            return asyncio.run(call_llm_api(image_bytes_list, user_description, feedback, previous_output))
-        except RuntimeError:
-            # No event loop running, we can use asyncio.run directly
-            import asyncio
-            return asyncio.run(call_llm_api(image_bytes_list, user_description, feedback, previous_output))
+        return submit_llm_api(image_bytes_list, user_description, feedback, previous_output).result()
     except Exception as e:
         print(f"Error in sync wrapper: {e}")
-        error_msg = f"Error: Failed to process bill data - {str(e)}"
-        empty_object = SplitwiseFormattedOutput(
-            persons={}, items=[], fees={}, item_shares={}, 
-            raw_fees=FeeCategorization(tax_items=[], delivery_items=[], tip_items=[])
-        )
-        return empty_object, error_msg
\ No newline at end of file
+        raise
\ No newline at end of file
@@ -0,0 +1,66 @@
+import asyncio
+import time
+from typing import Optional
+
+from loguru import logger
+
+
+class AsyncRateLimiter:
+    """Token-bucket request limiter with a cap on concurrent requests.
+
+    An instance must only be awaited from one event loop. ``llm_handler`` hands
+    every LLM call to its persistent background loop (``call_llm_api`` included
+    when awaited elsewhere), so plain ``asyncio`` primitives are enough. They are
+    created on first use, bound to that loop, and entering from a second loop
+    raises ``RuntimeError`` immediately. Waiters are served in FIFO order.
+
+    Usage:
+        async with limiter:
+            await agent.run(...)
+    """
+
+    def __init__(self, requests_per_minute: int, max_inflight: int):
+        if requests_per_minute <= 0 or max_inflight <= 0:
+            raise ValueError("requests_per_minute and max_inflight must be positive.")
+
+        self._capacity = float(requests_per_minute)
+        self._fill_rate = requests_per_minute / 60.0  # tokens per second
+        self._tokens = self._capacity
+        self._last_refill = time.monotonic()
+        self._max_inflight = max_inflight
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._bucket_lock: Optional[asyncio.Lock] = None
+        self._inflight: Optional[asyncio.Semaphore] = None
+
+    def _reserve(self) -> float:
+        """Takes one token and returns how many seconds to wait before it becomes valid."""
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self._fill_rate)
+        self._last_refill = now
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self._fill_rate
+
+    async def __aenter__(self) -> "AsyncRateLimiter":
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+            self._bucket_lock = asyncio.Lock()
+            self._inflight = asyncio.Semaphore(self._max_inflight)
+        elif self._loop is not loop:
+            # asyncio primitives would only fail once contended, fail on every call instead
+            raise RuntimeError("AsyncRateLimiter is bound to a different event loop.")
+
+        # Holding the lock while delayed queues later requests behind this one
+        async with self._bucket_lock:
+            delay = self._reserve()
+            if delay > 0:
+                logger.debug(f"Rate limit reached, delaying LLM request by {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+        await self._inflight.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self._inflight.release()
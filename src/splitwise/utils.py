@@ -0,0 +1,73 @@
+import io
+from typing import BinaryIO, Optional
+
+from PIL import Image, ImageOps
+
+from src.splitwise.config import MAX_IMAGE_BYTES, MAX_IMAGE_DIMENSION
+
+# Leading bytes of the image formats the LLM accepts
+_IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+)
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """Returns the media type of a JPEG/PNG from its leading bytes, or None for anything else."""
+    for signature, media_type in _IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return media_type
+    return None
+
+
+def validate_image_upload(uploaded_file: BinaryIO, max_bytes: int = MAX_IMAGE_BYTES) -> Optional[str]:
+    """
+    Cheap checks on an uploaded receipt image before it is decoded or sent anywhere.
+
+    Only the reported size and the first 16 bytes are inspected, so oversize or
+    mislabelled files are rejected without reading them fully.
+
+    Args:
+        uploaded_file: Streamlit UploadedFile (any seekable binary file with name and size)
+        max_bytes: Maximum accepted file size
+
+    Returns:
+        A user-facing error message, or None if the file looks like a supported image.
+    """
+    if uploaded_file.size > max_bytes:
+        return f"{uploaded_file.name} is larger than the {max_bytes / (1024 * 1024):.0f} MB limit."
+
+    uploaded_file.seek(0)
+    header = uploaded_file.read(16)
+    uploaded_file.seek(0)
+    if sniff_image_type(header) is None:
+        return f"{uploaded_file.name} is not a valid JPEG or PNG image."
+    return None
+
+
+def downscale_image(image_bytes: bytes, max_dimension: int = MAX_IMAGE_DIMENSION) -> bytes:
+    """
+    Shrinks a receipt photo so its longest side is at most max_dimension pixels.
+
+    Images already within the limit are returned unchanged (only the header is
+    decoded to read the size). Larger ones are re-encoded as JPEG, with the EXIF
+    orientation applied since re-encoding drops the tag.
+
+    Args:
+        image_bytes: Raw JPEG or PNG file contents
+        max_dimension: Maximum width/height of the result in pixels
+
+    Returns:
+        The original bytes, or JPEG bytes of the downscaled image.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    if max(image.size) <= max_dimension:
+        return image_bytes
+
+    # Lets the JPEG decoder scale down by a power of two while decoding
+    image.draft("RGB", (max_dimension, max_dimension))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    with io.BytesIO() as buffer:
+        image.save(buffer, format="JPEG", quality=85)
+        return buffer.getvalue()
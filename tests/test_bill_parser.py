@@ -0,0 +1,154 @@
+import pytest
+
+from src.splitwise.bill_parser import parse_bill_input, split_instacart_bill
+
+
+def _bill(persons="V: Vikram\nA: Alice", items="pizza: 12.00", fees="Tax: 1.00\nDelivery Fee: 2.00\nTip: 3.00",
+          shares="pizza: V, A"):
+    return f"""--- PERSONS ---
+{persons}
+
+--- ITEMS ---
+{items}
+
+--- FEES ---
+{fees}
+
+--- SHARES ---
+{shares}"""
+
+
+def test_warnings_are_printed_on_cache_hits(capsys):
+    bill = _bill(fees="Tax: 1.00\nDelivery Fee: 2.00", shares="pizza: V, A\nnot a share line")
+
+    first = parse_bill_input(bill)
+    first_out = capsys.readouterr().out
+    second = parse_bill_input(bill)
+    second_out = capsys.readouterr().out
+
+    assert first == second
+    assert "Warning: Fee 'Tip' not found in input. Assuming 0.00." in first_out
+    assert "Warning: Skipping malformed shares line: not a share line" in first_out
+    assert second_out == first_out
+
+
+def test_crlf_line_endings_inside_sections_are_stripped():
+    parsed = parse_bill_input(_bill(persons="V: Vikram\r\nA: Alice\r", shares="pizza: V, A\r"))
+
+    assert parsed['persons'] == {'V': 'Vikram', 'A': 'Alice'}
+    assert parsed['item_shares'] == {'pizza': ['V', 'A']}
+
+
+def test_only_newlines_split_section_lines():
+    # str.splitlines() would also break on these separators
+    parsed = parse_bill_input(_bill(items="pizza\x0bslice: 12.00\ngarlic\u2028bread: 4.00", shares=""))
+
+    assert [item['name'] for item in parsed['items']] == ['pizza\x0bslice', 'garlic\u2028bread']
+
+
+def test_empty_fee_value_fails_the_parse(capsys):
+    assert parse_bill_input(_bill(fees="Tax:\nTip: 3.00")) is None
+    assert "Error parsing fee amount for Tax: Tax:" in capsys.readouterr().out
+
+
+def test_line_without_colon_is_skipped_with_a_warning(capsys):
+    parsed = parse_bill_input(_bill(fees="Tax 1.00\nDelivery Fee: 2.00\nTip: 3.00"))
+
+    assert parsed['fees'] == {'Tax': 0.0, 'Delivery Fee': 2.0, 'Tip': 3.0}
+    assert "Warning: Skipping malformed fee line: Tax 1.00" in capsys.readouterr().out
+
+
+def test_keys_and_values_are_trimmed():
+    parsed = parse_bill_input(_bill(persons="  V :  Vikram  ", items="pizza :12.00", shares=" pizza:V ,"))
+
+    assert parsed['persons'] == {'V': 'Vikram'}
+    assert parsed['items'] == [{'name': 'pizza', 'price': 12.0}]
+    assert parsed['item_shares'] == {'pizza': ['V']}
+
+
+@pytest.mark.parametrize("header", ["--- PERSONS ---", "--- ITEMS ---", "--- FEES ---", "--- SHARES ---"])
+def test_missing_section_returns_none(capsys, header):
+    bill = _bill().replace(header, "--- OTHER ---")
+
+    assert parse_bill_input(bill) is None
+    assert "Error: Could not find all required sections" in capsys.readouterr().out
+
+
+def test_sections_out_of_order_return_none():
+    bill = _bill().replace("--- FEES ---", "--- TMP ---").replace("--- ITEMS ---", "--- FEES ---").replace("--- TMP ---", "--- ITEMS ---")
+
+    assert parse_bill_input(bill) is None
+
+
+def test_crlf_section_headers_are_not_recognised():
+    assert parse_bill_input(_bill().replace("\n", "\r\n")) is None
+
+
+def test_text_before_the_persons_header_is_ignored():
+    assert parse_bill_input("Here is the bill:\n" + _bill())['persons'] == {'V': 'Vikram', 'A': 'Alice'}
+
+
+def test_fee_names_are_matched_case_insensitively():
+    parsed = parse_bill_input(_bill(fees="tax: 1.00\nDELIVERY FEE: 2.00\nTiP: 3.00"))
+
+    assert parsed['fees'] == {'Tax': 1.0, 'Delivery Fee': 2.0, 'Tip': 3.0}
+
+
+def test_unexpected_fee_is_skipped_with_a_warning(capsys):
+    parsed = parse_bill_input(_bill(fees="Tax: 1.00\nService Fee: 2.00\nTip: 3.00"))
+
+    out = capsys.readouterr().out
+    assert parsed['fees'] == {'Tax': 1.0, 'Delivery Fee': 0.0, 'Tip': 3.0}
+    assert "Warning: Skipping unexpected fee line: Service Fee: 2.00" in out
+    assert "Warning: Fee 'Delivery Fee' not found in input. Assuming 0.00." in out
+
+
+NO_FEES = {'Tax': 0.0, 'Delivery Fee': 0.0, 'Tip': 0.0}
+
+# Expected totals below match the dict-based allocation split_instacart_bill replaced
+
+
+def test_split_duplicate_full_names_share_one_total():
+    totals = split_instacart_bill({'A': 'Al', 'B': 'Al', 'C': 'Cy'}, [{'name': 'x', 'price': 3.0}],
+                                  {**NO_FEES, 'Delivery Fee': 3.0}, {'x': ['A', 'B', 'C']})
+
+    # Al collects the item share of both abbreviations, but the delivery fee is divided by all three
+    assert totals == pytest.approx({'Al': 3.0, 'Cy': 2.0})
+
+
+def test_split_unknown_abbreviation_keeps_its_share_unallocated():
+    totals = split_instacart_bill({'A': 'Al', 'B': 'Bo'}, [{'name': 'x', 'price': 6.0}], NO_FEES, {'x': ['A', 'Q']})
+
+    assert totals == pytest.approx({'Al': 3.0, 'Bo': 0.0})
+
+
+def test_split_skips_zero_and_negative_priced_items():
+    items = [{'name': 'x', 'price': 0.0}, {'name': 'y', 'price': -1.0}, {'name': 'z', 'price': 4.0}]
+    totals = split_instacart_bill({'A': 'Al', 'B': 'Bo'}, items, {**NO_FEES, 'Tax': 1.0},
+                                  {'x': ['A'], 'y': ['A'], 'z': ['A', 'B']})
+
+    assert totals == pytest.approx({'Al': 2.5, 'Bo': 2.5})
+
+
+def test_split_tax_without_shared_items_is_not_allocated(capsys):
+    totals = split_instacart_bill({'A': 'Al', 'B': 'Bo'}, [{'name': 'x', 'price': 5.0}],
+                                  {**NO_FEES, 'Tax': 2.0, 'Tip': 2.0}, {})
+
+    assert totals == pytest.approx({'Al': 1.0, 'Bo': 1.0})
+    assert "Total cost of shared items is 0, but total tax is non-zero" in capsys.readouterr().out
+
+
+def test_split_with_no_persons_returns_empty():
+    assert split_instacart_bill({}, [{'name': 'x', 'price': 5.0}], {**NO_FEES, 'Tax': 2.0}, {'x': ['A']}) == {}
+
+
+def test_empty_persons_section_fails_the_parse(capsys):
+    assert parse_bill_input(_bill(persons="")) is None
+    assert "Error: No persons defined in --- PERSONS --- section." in capsys.readouterr().out
+
+
+def test_split_totals_are_plain_floats():
+    totals = split_instacart_bill({'A': 'Al'}, [{'name': 'x', 'price': 2.0}], {**NO_FEES, 'Tax': 0.5}, {'x': ['A']})
+
+    assert totals == {'Al': 2.5}
+    assert type(totals['Al']) is float
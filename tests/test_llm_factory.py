@@ -0,0 +1,37 @@
+import pytest
+
+from src.splitwise import llm_factory
+from src.splitwise.config import AzureModelConfig
+from src.splitwise.llm_factory import LLMProviderType, get_model
+
+
+@pytest.fixture
+def test_model(monkeypatch):
+    config = AzureModelConfig(
+        endpoint="https://example.openai.azure.com", api_key="test-key",
+        api_version="2024-12-01-preview", deployment_name="test-deployment",
+    )
+    monkeypatch.setitem(llm_factory.AZURE_MODELS, "test-model", config)
+    yield "test-model"
+    llm_factory._build_model.cache_clear()
+
+
+def test_get_model_is_cached_per_name_and_provider(test_model):
+    model = get_model(test_model, LLMProviderType.AZURE_OPENAI)
+
+    assert get_model(test_model) is model
+    assert model.model_name == "test-deployment"
+
+
+def test_get_model_accepts_unhashable_kwargs(test_model):
+    settings = {"temperature": 0.0}
+
+    model = get_model(test_model, settings=settings)
+
+    assert model.settings == settings
+    assert model is not get_model(test_model)
+
+
+def test_get_model_rejects_unknown_model():
+    with pytest.raises(ValueError, match="not found in AZURE_CONFIG"):
+        get_model("no-such-model")
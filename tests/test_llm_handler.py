@@ -0,0 +1,207 @@
+import asyncio
+from typing import List
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from src.splitwise import llm_handler
+from src.splitwise.class_models import DependencySplitwiseDeps, FeeCategorization, FeeItem, SplitwiseFormattedOutput
+from src.splitwise.rate_limiter import AsyncRateLimiter
+
+
+def test_call_llm_api_batch_bounds_concurrency_and_keeps_order(monkeypatch):
+    inflight = 0
+    peak = 0
+    loops = set()
+
+    async def fake_call_llm_api(image_bytes_list, user_description, feedback=None, previous_output=None):
+        nonlocal inflight, peak
+        loops.add(asyncio.get_running_loop())
+        inflight += 1
+        peak = max(peak, inflight)
+        try:
+            # The first bill finishes last, so results must not be in completion order
+            await asyncio.sleep(0.05 if user_description == "first" else 0.01)
+            if user_description == "broken":
+                raise ValueError("unreadable receipt")
+            return user_description
+        finally:
+            inflight -= 1
+
+    monkeypatch.setattr(llm_handler, "call_llm_api", fake_call_llm_api)
+    descriptions = ["first", "broken", "third", "fourth", "fifth"]
+    bill_requests = [{"image_bytes_list": [b"img"], "user_description": d} for d in descriptions]
+
+    results = asyncio.run(llm_handler.call_llm_api_batch(bill_requests, max_concurrent=2))
+
+    assert peak == 2
+    assert loops == {llm_handler._get_event_loop()}
+    assert results[0] == "first"
+    assert isinstance(results[1], ValueError)
+    assert results[2:] == ["third", "fourth", "fifth"]
+
+
+RAW_FEES = [
+    {"name": "Service Fee", "amount": 2.0, "category": "Tax"},
+    {"name": "Bag Fee", "amount": 0.5, "category": "Tax"},
+]
+
+
+def _use_function_agents(monkeypatch, categorized_fees, raw_fees=RAW_FEES):
+    """
+    Route call_llm_api through FunctionModel agents returning raw_fees and categorized_fees.
+
+    Returns the list that records each categorizer call.
+    """
+    categorizer_calls = []
+
+    async def parse_bill(messages, info: AgentInfo):
+        await asyncio.sleep(0.01)  # Hold the rate limiter long enough for calls to contend
+        args = {
+            "persons": {"V": "Vikram"},
+            "items": [{"name": "pizza", "price": 12.0}],
+            "fees": {"Tax": 0.0, "Delivery Fee": 0.0, "Tip": 0.0},
+            "item_shares": {"pizza": ["V"]},
+            "raw_fees": {"tax_items": raw_fees, "delivery_items": [], "tip_items": []},
+        }
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+    def categorize_fees(messages, info: AgentInfo):
+        categorizer_calls.append(messages)
+        args = {"tax_items": [], "delivery_items": categorized_fees, "tip_items": []}
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+    agents = (
+        Agent(FunctionModel(parse_bill), output_type=SplitwiseFormattedOutput, deps_type=DependencySplitwiseDeps),
+        Agent(FunctionModel(categorize_fees), output_type=FeeCategorization, deps_type=List[FeeItem]),
+    )
+    monkeypatch.setattr(llm_handler, "get_agents", lambda: agents)
+    return categorizer_calls
+
+
+IMAGE = b"\x89PNG\r\n\x1a\n" + b"0" * 16
+
+
+def _call(description):
+    return asyncio.run(llm_handler.call_llm_api([IMAGE], description))
+
+
+@pytest.mark.parametrize("categorized_fees", [
+    # Same count, one fee renamed
+    [{"name": "Service Charge", "amount": 2.0, "category": "Delivery Fee"},
+     {"name": "Bag Fee", "amount": 0.5, "category": "Delivery Fee"}],
+    # Same count, one fee re-priced
+    [{"name": "Service Fee", "amount": 2.5, "category": "Delivery Fee"},
+     {"name": "Bag Fee", "amount": 0.5, "category": "Delivery Fee"}],
+], ids=["renamed", "repriced"])
+def test_categorizer_output_with_changed_fees_is_rejected(monkeypatch, capsys, categorized_fees):
+    _use_function_agents(monkeypatch, categorized_fees)
+
+    bill, formatted = _call(f"fee drift {categorized_fees[0]['name']} {categorized_fees[0]['amount']}")
+
+    out = capsys.readouterr().out
+    assert "Fee mismatch between input and categorized fees" in out
+    assert "Missing from output: [('Service Fee', 2.0)]" in out
+    assert bill.raw_fees.delivery_items == []
+    assert bill.fees == {"Tax": 2.5, "Delivery Fee": 0.0, "Tip": 0.0}
+
+
+def test_categorizer_output_with_same_fees_is_accepted(monkeypatch, capsys):
+    categorized = [{**fee, "category": "Delivery Fee"} for fee in RAW_FEES]
+    _use_function_agents(monkeypatch, categorized)
+
+    bill, formatted = _call("fee drift none")
+
+    assert "Fee mismatch" not in capsys.readouterr().out
+    assert bill.fees == {"Tax": 0.0, "Delivery Fee": 2.5, "Tip": 0.0}
+    assert "Delivery Fee: 2.50" in formatted
+
+
+def _fee(name, amount=1.0):
+    return FeeItem(name=name, amount=amount, category="Tax")
+
+
+@pytest.mark.parametrize("name, category", [
+    ("Sales Tax", "Tax"),
+    ("Free Delivery", "Delivery Fee"),
+    ("Driver Tip", "Tip"),
+    ("Delivery Tip", None),  # Matches both delivery and tip keywords
+    ("Tips", None),  # Only whole words match
+    ("Service Fee", None),  # No keyword, left to the LLM
+])
+def test_rule_categorize(name, category):
+    assert llm_handler._rule_categorize(_fee(name)) == category
+
+
+def test_rule_categorize_fees_buckets_resolved_fees():
+    result = llm_handler._rule_categorize_fees([_fee("Sales Tax", 1.2), _fee("Free Delivery", -4.99), _fee("Driver Tip", 5.0)])
+
+    assert [(f.name, f.category) for f in result.tax_items] == [("Sales Tax", "Tax")]
+    assert [(f.name, f.category) for f in result.delivery_items] == [("Free Delivery", "Delivery Fee")]
+    assert [(f.name, f.category) for f in result.tip_items] == [("Driver Tip", "Tip")]
+
+
+def test_rule_categorize_fees_falls_back_if_any_fee_is_undecided():
+    assert llm_handler._rule_categorize_fees([_fee("Sales Tax"), _fee("Service Fee"), _fee("Driver Tip")]) is None
+
+
+def test_resolved_fees_skip_the_categorizer(monkeypatch):
+    raw_fees = [
+        {"name": "Sales Tax", "amount": 1.2, "category": "Tax"},
+        {"name": "Delivery Fee", "amount": 3.0, "category": "Tax"},
+        {"name": "Driver Tip", "amount": 2.0, "category": "Tax"},
+    ]
+    categorizer_calls = _use_function_agents(monkeypatch, [], raw_fees=raw_fees)
+
+    bill, _ = _call("rules only")
+
+    assert categorizer_calls == []
+    assert bill.fees == {"Tax": 1.2, "Delivery Fee": 3.0, "Tip": 2.0}
+
+
+def test_mixed_fees_go_to_the_categorizer(monkeypatch):
+    raw_fees = [
+        {"name": "Sales Tax", "amount": 1.2, "category": "Tax"},
+        {"name": "Service Fee", "amount": 2.0, "category": "Tax"},
+    ]
+    categorized = [{**fee, "category": "Delivery Fee"} for fee in raw_fees]
+    categorizer_calls = _use_function_agents(monkeypatch, categorized, raw_fees=raw_fees)
+
+    bill, _ = _call("rules and llm")
+
+    assert len(categorizer_calls) == 1
+    assert bill.fees == {"Tax": 0.0, "Delivery Fee": 3.2, "Tip": 0.0}
+
+
+def test_rate_limiter_survives_contention_from_two_loops(monkeypatch):
+    monkeypatch.setattr(llm_handler, "llm_rate_limiter", AsyncRateLimiter(requests_per_minute=6000, max_inflight=2))
+    _use_function_agents(monkeypatch, [{**fee, "category": "Delivery Fee"} for fee in RAW_FEES])
+
+    async def contend_on_caller_loop():
+        return await asyncio.gather(*(llm_handler.call_llm_api([IMAGE], f"caller loop {i}") for i in range(6)))
+
+    caller_results = asyncio.run(contend_on_caller_loop())
+    futures = [llm_handler.submit_llm_api([IMAGE], f"background loop {i}") for i in range(6)]
+    background_results = [future.result(timeout=10) for future in futures]
+
+    for bill, _ in caller_results + background_results:
+        assert bill.fees == {"Tax": 0.0, "Delivery Fee": 2.5, "Tip": 0.0}
+
+
+def test_batch_runs_on_the_background_loop_with_real_agents(monkeypatch, capsys):
+    monkeypatch.setattr(llm_handler, "llm_rate_limiter", AsyncRateLimiter(requests_per_minute=6000, max_inflight=2))
+    _use_function_agents(monkeypatch, [{**fee, "category": "Delivery Fee"} for fee in RAW_FEES])
+    bill_requests = [{"image_bytes_list": [IMAGE], "user_description": f"batch {i}"} for i in range(5)]
+
+    awaited = asyncio.run(llm_handler.call_llm_api_batch(bill_requests[:3], max_concurrent=3))
+    submitted = llm_handler.submit_llm_api_batch(bill_requests[3:], max_concurrent=2).result(timeout=10)
+    bill, _ = llm_handler.submit_llm_api([IMAGE], "after batch").result(timeout=10)
+
+    assert len(awaited) == 3 and len(submitted) == 2
+    for result in awaited + submitted:
+        assert not isinstance(result, BaseException)
+        assert result[0].fees == {"Tax": 0.0, "Delivery Fee": 2.5, "Tip": 0.0}
+    assert bill.fees == {"Tax": 0.0, "Delivery Fee": 2.5, "Tip": 0.0}
+    assert "bound to a different event loop" not in capsys.readouterr().out
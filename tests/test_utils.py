@@ -0,0 +1,75 @@
+import io
+
+from PIL import Image
+
+from src.splitwise.utils import downscale_image, validate_image_upload
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+JPEG_HEADER = b"\xff\xd8\xff\xe0"
+
+
+class FakeUpload(io.BytesIO):
+    """Stands in for a Streamlit UploadedFile, which is a BytesIO with name and size."""
+
+    def __init__(self, data: bytes, name: str = "receipt.png"):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+
+
+def test_validate_accepts_png_and_jpeg():
+    assert validate_image_upload(FakeUpload(PNG_HEADER + b"0" * 32)) is None
+    assert validate_image_upload(FakeUpload(JPEG_HEADER + b"0" * 32, "receipt.jpg")) is None
+
+
+def test_validate_rejects_oversized_file():
+    upload = FakeUpload(PNG_HEADER + b"0" * (2 * 1024 * 1024))
+
+    assert validate_image_upload(upload, max_bytes=1024 * 1024) == "receipt.png is larger than the 1 MB limit."
+
+
+def test_validate_rejects_other_formats():
+    upload = FakeUpload(b"GIF89a" + b"0" * 32, "receipt.png")
+
+    assert validate_image_upload(upload) == "receipt.png is not a valid JPEG or PNG image."
+
+
+def test_validate_resets_the_file_position():
+    upload = FakeUpload(PNG_HEADER + b"0" * 32)
+    upload.seek(10)
+
+    validate_image_upload(upload)
+
+    assert upload.tell() == 0
+
+
+def _encode(image, format, **params):
+    with io.BytesIO() as buffer:
+        image.save(buffer, format=format, **params)
+        return buffer.getvalue()
+
+
+def test_downscale_returns_small_images_unchanged():
+    image_bytes = _encode(Image.new("RGB", (100, 60), "white"), "PNG")
+
+    assert downscale_image(image_bytes, max_dimension=100) is image_bytes
+
+
+def test_downscale_shrinks_large_images_to_jpeg():
+    image_bytes = _encode(Image.new("RGBA", (400, 300), "white"), "PNG")
+
+    result = Image.open(io.BytesIO(downscale_image(image_bytes, max_dimension=100)))
+
+    assert result.format == "JPEG"
+    assert result.size == (100, 75)
+
+
+def test_downscale_applies_exif_orientation():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+    image_bytes = _encode(Image.new("RGB", (400, 200), "white"), "JPEG", exif=exif)
+
+    result = Image.open(io.BytesIO(downscale_image(image_bytes, max_dimension=100)))
+
+    assert result.size == (50, 100)
+    assert result.getexif().get(0x0112) is None